@@ -0,0 +1,108 @@
+"""Microbenchmarks for model validation/serialization and the opt-in fast path.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_models [--number N]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import timeit
+from typing import Any, Callable, Dict, List, Tuple, Type
+from uuid import uuid4
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic import BaseModel, EmailStr, create_model
+
+from models.address import AddressBase, AddressCreate, AddressRead, AddressUpdate
+from models.book import BookBase, BookCreate, BookRead, BookReplace, BookUpdate
+from models.health import Health
+from models.library import LibraryBase, LibraryCreate, LibraryRead, LibraryReplace, LibraryUpdate
+from models.person import PersonBase, PersonCreate, PersonRead, PersonUpdate
+from utils.fastpath import CachedEmailStr, list_adapter
+
+MODELS: List[Type[BaseModel]] = [
+    AddressBase, AddressCreate, AddressUpdate, AddressRead,
+    BookBase, BookCreate, BookReplace, BookUpdate, BookRead,
+    LibraryBase, LibraryCreate, LibraryReplace, LibraryUpdate, LibraryRead,
+    PersonBase, PersonCreate, PersonUpdate, PersonRead,
+    Health,
+]
+
+
+def example_payload(model: Type[BaseModel]) -> Dict[str, Any]:
+    """First example declared in the model's json_schema_extra."""
+    extra = model.model_config.get("json_schema_extra", {})
+    if "examples" in extra:
+        return dict(extra["examples"][0])
+    return dict(extra["example"])
+
+
+def bench(fn: Callable[[], Any], number: int) -> float:
+    """Best-of-3 ops/sec for fn."""
+    best = min(timeit.repeat(fn, number=number, repeat=3))
+    return number / best
+
+
+def report(name: str, ops: float, baseline: float | None = None) -> None:
+    line = f"{name:<44} {ops:>12,.0f} ops/s"
+    if baseline:
+        line += f"   x{ops / baseline:.2f}"
+    print(line)
+
+
+def bench_models(number: int) -> None:
+    print("== validate / dump / round-trip ==")
+    for model in MODELS:
+        payload = example_payload(model)
+        instance = model.model_validate(payload)
+        raw = instance.model_dump_json()
+        report(f"{model.__name__}.validate", bench(lambda: model.model_validate(payload), number))
+        report(f"{model.__name__}.dump_json", bench(instance.model_dump_json, number))
+        report(f"{model.__name__}.round_trip", bench(lambda: model.model_validate_json(raw), number))
+
+
+def person_models() -> Tuple[Type[BaseModel], Type[BaseModel]]:
+    """PersonCreate with plain EmailStr and with CachedEmailStr, independent of FASTAPIFASTPATH."""
+    plain = create_model("PersonCreatePlain", __base__=PersonCreate, email=(EmailStr, ...))
+    cached = create_model("PersonCreateCached", __base__=PersonCreate, email=(CachedEmailStr, ...))
+    return plain, cached
+
+
+def bench_fastpath(number: int, list_size: int) -> None:
+    print("== fast path: email memoization ==")
+    plain, cached = person_models()
+    payload = example_payload(PersonCreate)
+    base = bench(lambda: plain.model_validate(payload), number)
+    report("PersonCreate.validate (EmailStr)", base)
+    report("PersonCreate.validate (CachedEmailStr)", bench(lambda: cached.model_validate(payload), number), base)
+
+    print(f"== fast path: List[PersonRead] response, {list_size} items ==")
+    people = [PersonRead(**{**example_payload(PersonRead), "id": uuid4()}) for _ in range(list_size)]
+    field = create_model_field(name="Response_list_persons", type_=List[PersonRead], mode="serialization")
+
+    def fastapi_path() -> bytes:
+        content = asyncio.run(serialize_response(field=field, response_content=people, is_coroutine=False))
+        return json.dumps(content).encode()
+
+    adapter = list_adapter(PersonRead)
+    list_number = max(1, number // list_size)
+    base = bench(fastapi_path, list_number)
+    report("response_model serialization", base)
+    report("TypeAdapter.dump_json", bench(lambda: adapter.dump_json(people), list_number), base)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000, help="Iterations per measurement")
+    parser.add_argument("--list-size", type=int, default=200, help="Items in list-response benchmarks")
+    args = parser.parse_args()
+    bench_models(args.number)
+    bench_fastpath(args.number, args.list_size)
+
+
+if __name__ == "__main__":
+    main()
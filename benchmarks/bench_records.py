@@ -0,0 +1,100 @@
+"""Bytes per stored record: pydantic *Read models vs compact slotted records.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_records [--count N]
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import random
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+from uuid import uuid4
+
+from models.address import AddressRead
+from models.book import BookRead
+from models.library import LibraryRead
+from models.person import PersonRead
+from services.records import BookRecord, LibraryRecord
+from services.store import AddressStore, PersonStore, RecordStore
+
+CITIES = [("New York", "NY", "USA"), ("London", None, "UK"), ("Washington", "DC", "USA"), ("Paris", None, "France")]
+AUTHORS = ["Hopper", "Lovelace", "Knuth", "Liskov", "Dijkstra"]
+
+
+def make_address(i: int, model: type = AddressRead) -> Any:
+    city, state, country = random.choice(CITIES)
+    # fresh string objects, as they would arrive from parsed request bodies
+    return model(street=f"{i} Main St", city="".join(city), state=state and "".join(state),
+                 postal_code=f"{10000 + i % 90000}", country="".join(country))
+
+
+def make_person(i: int, address_pool: int = 0) -> PersonRead:
+    address = make_address(i % address_pool if address_pool else i)
+    return PersonRead(
+        uni=f"ab{i % 10000}", first_name=f"First{i}", last_name=f"Last{i}", email=f"user{i}@example.com",
+        phone="+1-212-555-0199", birth_date="1990-01-01",
+        addresses=[address.model_dump(include=set(AddressRead.model_fields) - {"created_at", "updated_at"})],
+    )
+
+
+def make_book(i: int) -> BookRead:
+    return BookRead(id=uuid4(), title=f"Title {i}", author="".join(random.choice(AUTHORS)), price=9.99 + i % 50)
+
+
+def make_library(i: int) -> LibraryRead:
+    return LibraryRead(id=uuid4(), code=f"L{i}", name=f"Library {i}")
+
+
+FACTORIES: List[Tuple[str, Callable[[int], Any], Callable[[], RecordStore]]] = [
+    # persons include the shared address table rows they create
+    ("persons", make_person, lambda: PersonStore(AddressStore())),
+    # persons living at one of 500 distinct addresses, where content dedup applies
+    ("persons*", lambda i: make_person(i, address_pool=500), lambda: PersonStore(AddressStore())),
+    ("addresses", make_address, AddressStore),
+    ("books", make_book, lambda: RecordStore(BookRecord)),
+    ("libraries", make_library, lambda: RecordStore(LibraryRecord)),
+]
+
+
+def measure(fill: Callable[[], Any]) -> int:
+    """Bytes retained by whatever fill() returns."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fill()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000, help="Records per collection")
+    args = parser.parse_args()
+
+    for name, factory, new_store in FACTORIES:
+        # both sides build fresh objects, so only what each layout retains is counted
+        def fill_models() -> Dict[Any, Any]:
+            random.seed(0)
+            return {m.id: m for m in map(factory, range(args.count))}
+
+        def fill_records() -> RecordStore:
+            random.seed(0)
+            store = new_store()
+            for m in map(factory, range(args.count)):
+                store[m.id] = m
+            return store
+
+        model_bytes = measure(fill_models) / args.count
+        record_bytes = measure(fill_records) / args.count
+        print(f"{name:<10} models {model_bytes:>8.0f} B/record   records {record_bytes:>8.0f} B/record"
+              f"   -{100 * (1 - record_bytes / model_bytes):.0f}%")
+
+
+if __name__ == "__main__":
+    main()
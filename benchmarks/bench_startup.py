@@ -0,0 +1,88 @@
+"""Import-to-first-response time for a fresh server process.
+
+Starts uvicorn on main:app, polls until the first response, then times the
+first /openapi.json hit; reports medians with and without the build-time schema.
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [--runs N]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List
+
+from framework.openapi import ROOT_DIR
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_response(url: str, deadline: float) -> float:
+    """Poll url until it answers; return the time of the first response."""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                resp.read()
+                return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.005)
+    raise TimeoutError(f"No response from {url}")
+
+
+def run_once(env: Dict[str, str]) -> Dict[str, float]:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        ready = first_response(base + "/", start + 30)
+        openapi_start = time.perf_counter()
+        urllib.request.urlopen(base + "/openapi.json").read()
+        openapi_done = time.perf_counter()
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {
+        "first_response_ms": (ready - start) * 1000,
+        "first_openapi_ms": (openapi_done - openapi_start) * 1000,
+    }
+
+
+def measure(label: str, env: Dict[str, str], runs: int) -> None:
+    samples: List[Dict[str, float]] = [run_once(env) for _ in range(runs)]
+    for key in samples[0]:
+        median = statistics.median(s[key] for s in samples)
+        print(f"{label:<24} {key:<18} {median:>9.1f} ms (median of {runs})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Server starts per configuration")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        schema = os.path.join(tmp, "openapi.json")
+        env = dict(os.environ, FASTAPIOPENAPIFILE=schema)
+        measure("schema built on demand", env, args.runs)
+        subprocess.run([sys.executable, "-m", "framework.openapi", schema], cwd=ROOT_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        measure("prebuilt schema", env, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Build-time OpenAPI generation and static serving of the schema and docs pages.
+
+Generate the schema once as part of the build:
+
+    python -m framework.openapi [output_path]
+
+At runtime the stored bytes are served as-is, so the first /openapi.json or
+/docs hit on a fresh pod does not walk every model's json_schema_extra. The
+file carries a fingerprint of the app's routes and their models; a file built
+from different code is ignored and the schema is generated instead.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+from typing import List, Optional
+
+from fastapi import FastAPI, Response
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPENAPI_FILE = os.environ.get("FASTAPIOPENAPIFILE", os.path.join(ROOT_DIR, "openapi.json"))
+
+
+FINGERPRINT_KEY = "x-routes-fingerprint"
+
+
+def _describe_type(annotation, seen: set) -> str:
+    """repr of a type, expanding pydantic models into their fields (recursively, once each)."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        name = f"{annotation.__module__}.{annotation.__qualname__}"
+        if name in seen:
+            return name
+        seen.add(name)
+        fields = ",".join(
+            f"{field}:{_describe_type(info.annotation, seen)}:{info.is_required()}"
+            for field, info in annotation.model_fields.items()
+        )
+        return f"{name}({fields})"
+    args = getattr(annotation, "__args__", None)
+    if args:
+        return f"{getattr(annotation, '__origin__', annotation)}[{','.join(_describe_type(a, seen) for a in args)}]"
+    return repr(annotation)
+
+
+def routes_fingerprint(app: FastAPI) -> str:
+    """Hash of what the schema is generated from: routes, parameters and models, plus the app version.
+
+    Much cheaper than generating the schema, so it can be checked at startup.
+    """
+    parts: List[str] = [app.version]
+    seen: set = set()
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or not route.include_in_schema:
+            continue
+        params = sorted(
+            f"{param.field_info.__class__.__name__}:{param.name}:{_describe_type(param.field_info.annotation, seen)}"
+            for param in route.dependant.query_params + route.dependant.path_params
+            + route.dependant.header_params + route.dependant.body_params
+        )
+        parts.append("|".join([
+            route.path, ",".join(sorted(route.methods)), route.name, str(route.status_code),
+            _describe_type(route.response_model, seen), route.description or "", *params,
+        ]))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def build_openapi(app: FastAPI) -> bytes:
+    schema = app.openapi()
+    schema["info"][FINGERPRINT_KEY] = routes_fingerprint(app)
+    return json.dumps(schema, separators=(",", ":")).encode("utf-8")
+
+
+def write_openapi(app: FastAPI, path: str = OPENAPI_FILE) -> int:
+    body = build_openapi(app)
+    with open(path, "wb") as fh:
+        fh.write(body)
+    return len(body)
+
+
+def load_openapi(app: FastAPI, path: str = OPENAPI_FILE) -> Optional[bytes]:
+    """Stored schema bytes, or None if missing or built from different routes/models."""
+    try:
+        with open(path, "rb") as fh:
+            body = fh.read()
+    except FileNotFoundError:
+        return None
+    if json.loads(body).get("info", {}).get(FINGERPRINT_KEY) != routes_fingerprint(app):
+        return None
+    return body
+
+
+def install_openapi(
+    app: FastAPI,
+    path: str = OPENAPI_FILE,
+    openapi_url: str = "/openapi.json",
+    docs_url: str = "/docs",
+    redoc_url: str = "/redoc",
+) -> None:
+    """Serve the stored schema (falling back to building it once) plus the docs pages.
+
+    The app must be created with openapi_url/docs_url/redoc_url set to None.
+    """
+    cache: dict = {}
+
+    def schema_bytes() -> bytes:
+        body = cache.get("schema")
+        if body is None:
+            body = load_openapi(app, path) or build_openapi(app)
+            cache["schema"] = body
+        return body
+
+    swagger_html = get_swagger_ui_html(openapi_url=openapi_url, title=app.title + " - Swagger UI").body
+    redoc_html = get_redoc_html(openapi_url=openapi_url, title=app.title + " - ReDoc").body
+
+    @app.get(openapi_url, include_in_schema=False)
+    def openapi_json():
+        return Response(content=schema_bytes(), media_type="application/json")
+
+    @app.get(docs_url, include_in_schema=False)
+    def swagger_ui():
+        return Response(content=swagger_html, media_type="text/html")
+
+    @app.get(redoc_url, include_in_schema=False)
+    def redoc():
+        return Response(content=redoc_html, media_type="text/html")
+
+
+if __name__ == "__main__":
+    from main import app
+
+    target = sys.argv[1] if len(sys.argv) > 1 else OPENAPI_FILE
+    size = write_openapi(app, target)
+    print(f"Wrote {size} bytes of OpenAPI schema to {target}")
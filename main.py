@@ -1,89 +1,205 @@
 from __future__ import annotations
 
+import json
 import os
+import secrets
+from itertools import islice
 import socket
+from contextlib import asynccontextmanager
 from datetime import datetime
 
-from typing import Dict, List
+from typing import Any, Dict, List, Set, Tuple
 from uuid import UUID
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi import Query, Path
 from typing import Optional
+from pydantic import TypeAdapter
 
 from models.person import PersonCreate, PersonRead, PersonUpdate
 from models.address import AddressCreate, AddressRead, AddressUpdate
 from models.health import Health
 from models.book import BookCreate, BookRead, BookUpdate, BookReplace
 from models.library import LibraryCreate, LibraryRead, LibraryUpdate, LibraryReplace
+from models.batch import BatchGetRequest
+from models.holding import HoldingRead, HoldingUpdate, LibraryAvailability
+from utils.fastpath import list_response
+from framework.openapi import install_openapi
+from middleware.profiling import install_profiling
+from middleware.timing import install_timing
+from middleware.compression import install_compression
+from middleware.admission import install_admission
+from middleware.idempotency import install_idempotency
+from utils.metrics import render_prometheus
+from utils.memory import estimate_size, memory_report, register_index
+from services.records import BookRecord, LibraryRecord, unpack_datetime
+from services.store import AddressConflict, AddressStore, PersonStore, RecordStore, watch
+from services.changes import RESOURCES, ChangeFeed
+from services.holdings import HoldingConflict, HoldingStore
+from services.search import SearchIndex, top_k
+from services.autocomplete import PrefixIndex
+from services.sorting import SortedView, parse_sort, top_records
+from services.facets import FacetIndex
 from uuid import uuid4
 
 port = int(os.environ.get("FASTAPIPORT", 8000))
-
-persons: Dict[UUID, PersonRead] = {}
-addresses: Dict[UUID, AddressRead] = {}
-books: Dict[UUID, BookRead] = {}
-libraries: Dict[UUID, LibraryRead] = {}
-
-def add_data():
-    book1 = BookRead(
-        # id=uuid4(),
-        id=UUID("90143569-66f2-493d-a4a6-b519bb75d10a"),
-        title="Tgggg",
-        author="Fgggg",
-        price=33.33
-    )
-    book2 = BookRead(
-        # id=uuid4(),
-        id=UUID("de1288cc-5eb7-42b1-9e66-5a4b9a29a261"),
-        title="Bidenbook",
-        author="Ggggg",
-        price=1333.99
-    )
-    book3 = BookRead(
-        # id=uuid4(),
-        id=UUID("634af327-9d9d-49fd-a671-2cef810de932"),
-        title="Ddddddd",
-        author="Hhhhhh",
-        price=14.00
-    )
-    books[book1.id] = book1
-    books[book2.id] = book2
-    books[book3.id] = book3
-
-    lib1 = LibraryRead(
-        # id=uuid4(),
-        id=UUID("7c8f1060-db19-4e6f-b087-2f944c4aede5"),
-        code="BUT",
-        name="Butler Library"
-    )
-    lib2 = LibraryRead(
-        # id=uuid4(),
-        id=UUID("cc8b6202-2568-411a-aa47-e138c7bd0f4e"),
-        code="AVY",
-        name="Avery Architectural & Fine Arts Library"
-    )
-    lib3 = LibraryRead(
-        # id=uuid4(),
-        id=UUID("b8a518f6-c4ff-459d-b5c1-973d1b8b3c7d"),
-        code="SEL",
-        name="Science & Engineering Library"
+LIST_CONCURRENCY = int(os.environ.get("FASTAPILISTCONCURRENCY", 8))
+CHANGE_BUFFER = int(os.environ.get("FASTAPICHANGEBUFFER", 10000))
+SUBSCRIBER_QUEUE = int(os.environ.get("FASTAPISUBSCRIBERQUEUE", 1000))
+SSE_HEARTBEAT = float(os.environ.get("FASTAPISSEHEARTBEAT", 15))
+# /debug/memory answers only requests carrying X-Debug-Token with this value
+DEBUG_TOKEN = os.environ.get("FASTAPIDEBUGTOKEN")
+SEED_FILE = os.environ.get("FASTAPISEEDFILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "seed.json"))
+
+# One address table, shared by /addresses and the addresses embedded in persons
+addresses = AddressStore()
+persons = PersonStore(addresses)
+books: RecordStore[BookRecord] = RecordStore(BookRecord)
+libraries: RecordStore[LibraryRecord] = RecordStore(LibraryRecord)
+# Copies of books held by libraries, indexed both ways
+holdings = HoldingStore()
+
+# Full-text indexes behind /search, following their stores
+SEARCH_STORES: Dict[str, RecordStore] = {"books": books, "persons": persons}
+search_indexes = {
+    "books": SearchIndex(("title", "author")),
+    "persons": SearchIndex(("first_name", "last_name", "email")),
+}
+for _name, _index in search_indexes.items():
+    watch(SEARCH_STORES[_name], _index)
+    register_index(f"{_name}.search", lambda sample, index=_index: estimate_size(index.postings, sample))
+
+# sort= fields per list endpoint; common orders are kept as maintained views,
+# the rest are served by heap selection
+BOOK_SORTS = ("price", "title", "created_at")
+PERSON_SORTS = ("last_name", "birth_date")
+LIBRARY_SORTS = ("code", "name")
+sort_views: Dict[Tuple[str, str], SortedView] = {}
+for _store_name, _store, _field in (
+    ("books", books, "price"),
+    ("books", books, "title"),
+    ("persons", persons, "last_name"),
+    ("libraries", libraries, "code"),
+    ("libraries", libraries, "name"),
+):
+    _view = sort_views[(_store_name, _field)] = SortedView(_field)
+    watch(_store, _view)
+    register_index(f"{_store_name}.sorted_by_{_field}", lambda sample, view=_view: estimate_size(view.keys, sample))
+
+# Facet counters behind /{addresses,persons,books}/facets; a person counts once
+# per distinct value across its addresses
+ADDRESS_FACETS = ("country", "state", "city")
+
+def person_address_values(record) -> Dict[str, frozenset]:
+    rows = [addresses.row(aid) for aid in record.addresses]
+    return {field: frozenset(v for v in (getattr(row, field) for row in rows) if v is not None) for field in ADDRESS_FACETS}
+
+address_facets = FacetIndex(ADDRESS_FACETS)
+person_facets = FacetIndex(ADDRESS_FACETS, values=person_address_values)
+book_facets = FacetIndex(("author",))
+for _name, _store, _index in (("addresses", addresses, address_facets), ("persons", persons, person_facets), ("books", books, book_facets)):
+    watch(_store, _index)
+    register_index(f"{_name}.facets", lambda sample, index=_index: estimate_size(index.scoped, sample))
+
+# Type-ahead indexes behind /autocomplete, keyed "<resource>.<field>"
+autocomplete_indexes: Dict[str, PrefixIndex] = {}
+for _store_name, _store, _field in (
+    ("libraries", libraries, "name"),
+    ("libraries", libraries, "code"),
+    ("books", books, "title"),
+    ("persons", persons, "last_name"),
+):
+    _index = autocomplete_indexes[f"{_store_name}.{_field}"] = PrefixIndex(_field)
+    watch(_store, _index)
+    register_index(f"{_store_name}.autocomplete.{_field}", lambda sample, index=_index: estimate_size(index.forms, sample))
+
+changes = ChangeFeed(capacity=CHANGE_BUFFER, subscriber_queue=SUBSCRIBER_QUEUE)
+register_index("changes.buffer", lambda sample: estimate_size(changes.buffer, sample))
+
+register_index("addresses.refs", lambda sample: estimate_size(addresses.refs, sample))
+register_index("addresses.by_content", lambda sample: estimate_size(addresses.by_content, sample))
+for _field, _index in addresses.indexes.items():
+    register_index(f"addresses.by_{_field}", lambda sample, index=_index: estimate_size(index, sample))
+register_index("persons.by_address", lambda sample: estimate_size(persons.by_address, sample))
+register_index("holdings.by_library", lambda sample: estimate_size(holdings.by_library, sample))
+register_index("holdings.by_book", lambda sample: estimate_size(holdings.by_book, sample))
+
+# Stores behind GET /{resource}/changes
+SYNC_STORES: Dict[str, RecordStore] = {"persons": persons, "addresses": addresses, "books": books, "libraries": libraries}
+for _name, _store in SYNC_STORES.items():
+    register_index(f"{_name}.change_index", lambda sample, store=_store: estimate_size(store.change_keys, sample))
+
+def change_publisher(resource: str, store: RecordStore):
+    """Store feed publishing each write to /events, called under the store lock so sequence follows commit order."""
+    def publish(action: str, record_id: int, record) -> None:
+        changes.publish(resource, action, UUID(int=record_id), None if record is None else store.unpack(record))
+    return publish
+
+CHANGE_PUBLISHERS = {name: change_publisher(name, store) for name, store in SYNC_STORES.items()}
+
+def load_fixtures(path: str) -> None:
+    """Seed the in-memory stores from a JSON fixture file, if one is present."""
+    try:
+        with open(path, "rb") as fh:
+            data = json.load(fh)
+    except FileNotFoundError:
+        return
+
+    seeds = (
+        # addresses first, so standalone rows are pinned before persons reference them
+        ("addresses", addresses, AddressRead),
+        ("persons", persons, PersonRead),
+        ("books", books, BookRead),
+        ("libraries", libraries, LibraryRead),
     )
-    libraries[lib1.id] = lib1
-    libraries[lib2.id] = lib2
-    libraries[lib3.id] = lib3
-
+    for key, store, model in seeds:
+        for item in TypeAdapter(List[model]).validate_python(data.get(key, [])):
+            store[item.id] = item
+    for holding in data.get("holdings", []):
+        holdings.set_copies(UUID(holding["library_id"]).int, UUID(holding["book_id"]).int, holding["copies"])
 
     print(f"Book IDs: {list(books.keys())}")
     print(f"Library IDs: {list(libraries.keys())}")
 
-add_data()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_fixtures(SEED_FILE)
+    # the seed is the feed's starting state; writes from here on are published
+    for name, store in SYNC_STORES.items():
+        if CHANGE_PUBLISHERS[name] not in store.feeds:
+            store.feeds.append(CHANGE_PUBLISHERS[name])
+    yield
 
 app = FastAPI(
     title="Person/Address/Book/Library API",
     description="Demo FastAPI app using Pydantic v2 models for Person, Address, Book, and Library",
     version="0.1.0",
+    lifespan=lifespan,
+    # Served from the build-time schema by install_openapi below
+    openapi_url=None,
+    docs_url=None,
+    redoc_url=None,
 )
+install_timing(app)
+install_profiling(app, annotate=lambda: {
+    "persons": len(persons),
+    "addresses": len(addresses),
+    "books": len(books),
+    "libraries": len(libraries),
+})
+install_admission(app, route_limits={
+    f"GET {path}": LIST_CONCURRENCY for path in ("/persons", "/addresses", "/books", "/libraries", "/search")
+}, exempt=("/health", "/metrics", "/events"))
+# outside admission control: waiting duplicates hold no slot, shed requests are not remembered
+install_idempotency(app)
+install_compression(app, versions={
+    "/persons": lambda: (persons.version, addresses.version),
+    "/addresses": lambda: addresses.version,
+    "/books": lambda: books.version,
+    "/libraries": lambda: libraries.version,
+})
+install_openapi(app)
 
 # -----------------------------------------------------------------------------
 # Address endpoints
@@ -111,6 +227,182 @@ def get_health_with_path(
 ):
     return make_health(echo=echo, path_echo=path_echo)
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/memory", include_in_schema=False)
+def get_debug_memory(
+    sample: int = Query(100, description="Entries sampled per collection for size estimates", ge=1, le=10000),
+    tracemalloc_top: int = Query(0, description="Top allocators to report; the first request starts tracing", ge=0, le=100),
+    tracemalloc_stop: bool = Query(False, description="Stop tracing started by tracemalloc_top"),
+    x_debug_token: Optional[str] = Header(None),
+):
+    # disabled unless a token is configured; tracing has a process-wide cost
+    if DEBUG_TOKEN is None or x_debug_token is None or not secrets.compare_digest(x_debug_token, DEBUG_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return memory_report(
+        {"persons": persons.data, "addresses": addresses.data, "books": books.data, "libraries": libraries.data},
+        sample=sample,
+        top=tracemalloc_top,
+        stop=tracemalloc_stop,
+    )
+
+# -----------------------------------------------------------------------------
+# Delta sync
+# -----------------------------------------------------------------------------
+def format_since(key: Tuple[int, int]) -> str:
+    return f"{key[0]}.{key[1]:x}"
+
+def parse_since(token: str) -> Tuple[int, int]:
+    stamp, _, id_hex = token.partition(".")
+    try:
+        return int(stamp), int(id_hex, 16)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed since token")
+
+# Declared before the /{resource}/{id} routes, which would otherwise capture "changes"
+@app.get("/{resource}/changes")
+def list_changes(
+    resource: str = Path(..., description="persons, addresses, books or libraries"),
+    since: Optional[str] = Query(None, description="next_since from the previous page; omit for a full sync"),
+    limit: int = Query(100, description="Maximum number of changes to return", ge=1, le=1000),
+):
+    store = SYNC_STORES.get(resource)
+    if store is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    after = None if since is None else parse_since(since)
+    if after is not None and after < store.horizon:
+        raise HTTPException(status_code=410, detail="since token predates retained tombstones; start a full sync")
+
+    entries, has_more = store.changes_since(after, limit)
+    items, deleted = [], []
+    for (stamp, id_int), record in entries:
+        if record is None:
+            deleted.append({"id": UUID(int=id_int), "deleted_at": unpack_datetime(stamp)})
+        else:
+            items.append(store.unpack(record))
+    return {
+        "items": items,
+        "deleted": deleted,
+        "next_since": format_since(entries[-1][0]) if entries else since,
+        "has_more": has_more,
+    }
+
+# -----------------------------------------------------------------------------
+# Facets (declared before the /{resource}/{id} routes)
+# -----------------------------------------------------------------------------
+def facet_counts(index: FacetIndex, fields: str, filters: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in index.fields]
+    if unknown or not wanted:
+        raise HTTPException(status_code=400, detail=f"fields must be among: {', '.join(index.fields)}")
+    given = [(field, value) for field, value in filters.items() if value is not None]
+    if len(given) > 1:
+        raise HTTPException(status_code=400, detail="Facets can be scoped by one filter at a time")
+    return {
+        "scope": dict(given) or None,
+        "facets": index.facets(wanted, given[0] if given else None),
+    }
+
+@app.get("/addresses/facets")
+def address_facet_counts(
+    fields: str = Query("country,state,city", description="Facet fields separated by comma: country, state, city"),
+    city: Optional[str] = Query(None, description="Count only addresses in this city"),
+    state: Optional[str] = Query(None, description="Count only addresses in this state/region"),
+    country: Optional[str] = Query(None, description="Count only addresses in this country"),
+):
+    return facet_counts(address_facets, fields, {"city": city, "state": state, "country": country})
+
+@app.get("/persons/facets")
+def person_facet_counts(
+    fields: str = Query("country,state,city", description="Facet fields separated by comma: country, state, city"),
+    city: Optional[str] = Query(None, description="Count only persons with an address in this city"),
+    country: Optional[str] = Query(None, description="Count only persons with an address in this country"),
+):
+    return facet_counts(person_facets, fields, {"city": city, "country": country})
+
+@app.get("/books/facets")
+def book_facet_counts(
+    fields: str = Query("author", description="Facet fields separated by comma: author"),
+):
+    return facet_counts(book_facets, fields, {})
+
+# -----------------------------------------------------------------------------
+# Sorting
+# -----------------------------------------------------------------------------
+def parse_sort_param(sort: Optional[str], allowed: Tuple[str, ...]) -> Optional[Tuple[str, bool]]:
+    if sort is None:
+        return None
+    try:
+        return parse_sort(sort, allowed)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+def sorted_page(store: RecordStore, name: str, order: Optional[Tuple[str, bool]], results: Optional[List],
+                offset: int, limit: Optional[int]) -> List:
+    """One page of records; results None means the unfiltered collection.
+
+    Unsorted pages keep scan order. An unfiltered page in a maintained order is
+    a slice of its view; anything else takes the first offset+limit by heap.
+    """
+    end = None if limit is None else offset + limit
+    if order is None:
+        return list(islice(store.data.values() if results is None else results, offset, end))
+    field, descending = order
+    view = sort_views.get((name, field))
+    if results is None and view is not None:
+        return view.page(store.data, offset, len(store) if limit is None else limit, descending)
+    # snapshot: the heap calls back into Python per row, so a live dict view could change under it
+    rows = list(store.data.values()) if results is None else results
+    return top_records(rows, field, descending, len(rows) if end is None else end)[offset:]
+
+# -----------------------------------------------------------------------------
+# Field projection and batch lookup
+# -----------------------------------------------------------------------------
+def parse_fields(model: type, fields: Optional[str]) -> Optional[Set[str]]:
+    """Requested fields known to model, or None for the whole entity."""
+    if fields is None:
+        return None
+    return {f.strip() for f in fields.split(",") if f.strip() in model.model_fields}
+
+def project(item: Any, wanted: Optional[Set[str]]) -> Any:
+    return item if wanted is None else item.model_dump(mode="json", include=wanted)
+
+def batch_get(store: RecordStore, ids: List[UUID], fields: Optional[str]) -> Dict[str, Any]:
+    """Found entities (in request order, projected) and missing IDs, in one pass of dict lookups."""
+    wanted = parse_fields(store.record_cls.model, fields)
+    items, missing = [], []
+    for item_id in dict.fromkeys(ids):
+        # through get(), which reads address aliases like GET /{resource}/{id}
+        model = store.get(item_id)
+        if model is None:
+            missing.append(item_id)
+        else:
+            items.append(project(model, wanted))
+    return {"items": items, "missing": missing}
+
+FIELDS_QUERY = Query(None, description=" fields to return separated by comma(e.g., 'title,price')")
+
+@app.post("/persons:batchGet")
+def batch_get_persons(request: BatchGetRequest, fields: Optional[str] = FIELDS_QUERY):
+    return batch_get(persons, request.ids, fields)
+
+@app.post("/addresses:batchGet")
+def batch_get_addresses(request: BatchGetRequest, fields: Optional[str] = FIELDS_QUERY):
+    return batch_get(addresses, request.ids, fields)
+
+@app.post("/books:batchGet")
+def batch_get_books(request: BatchGetRequest, fields: Optional[str] = FIELDS_QUERY):
+    return batch_get(books, request.ids, fields)
+
+@app.post("/libraries:batchGet")
+def batch_get_libraries(request: BatchGetRequest, fields: Optional[str] = FIELDS_QUERY):
+    return batch_get(libraries, request.ids, fields)
+
+# -----------------------------------------------------------------------------
+# Address endpoints
+# -----------------------------------------------------------------------------
 @app.post("/addresses", response_model=AddressRead, status_code=201)
 def create_address(address: AddressCreate):
     if address.id in addresses:
@@ -126,20 +418,20 @@ def list_addresses(
     postal_code: Optional[str] = Query(None, description="Filter by postal code"),
     country: Optional[str] = Query(None, description="Filter by country"),
 ):
-    results = list(addresses.values())
+    # city/state/country go through the address table's indexes
+    indexed = [(field, value) for field, value in (("city", city), ("state", state), ("country", country)) if value is not None]
+    if indexed:
+        ids = set.intersection(*(addresses.lookup(field, value) for field, value in indexed))
+        results = addresses.in_insertion_order(ids)
+    else:
+        results = list(addresses.data.values())
 
     if street is not None:
         results = [a for a in results if a.street == street]
-    if city is not None:
-        results = [a for a in results if a.city == city]
-    if state is not None:
-        results = [a for a in results if a.state == state]
     if postal_code is not None:
         results = [a for a in results if a.postal_code == postal_code]
-    if country is not None:
-        results = [a for a in results if a.country == country]
 
-    return results
+    return list_response(AddressRead, [addresses.unpack(a) for a in results])
 
 @app.get("/addresses/{address_id}", response_model=AddressRead)
 def get_address(address_id: UUID):
@@ -153,18 +445,26 @@ def update_address(address_id: UUID, update: AddressUpdate):
         raise HTTPException(status_code=404, detail="Address not found")
     stored = addresses[address_id].model_dump()
     stored.update(update.model_dump(exclude_unset=True))
+    stored["updated_at"] = datetime.utcnow()
+    # persons embedding the row are bumped by the store
     addresses[address_id] = AddressRead(**stored)
     return addresses[address_id]
 
+def put_person(person_read: PersonRead) -> PersonRead:
+    """Store a person, mapping an embedded address that would overwrite a shared row to 409."""
+    try:
+        persons.put(person_read)
+    except AddressConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return persons[person_read.id]
+
 # -----------------------------------------------------------------------------
 # Person endpoints
 # -----------------------------------------------------------------------------
 @app.post("/persons", response_model=PersonRead, status_code=201)
 def create_person(person: PersonCreate):
     # Each person gets its own UUID; stored as PersonRead
-    person_read = PersonRead(**person.model_dump())
-    persons[person_read.id] = person_read
-    return person_read
+    return put_person(PersonRead(**person.model_dump()))
 
 @app.get("/persons", response_model=List[PersonRead])
 def list_persons(
@@ -176,8 +476,22 @@ def list_persons(
     birth_date: Optional[str] = Query(None, description="Filter by date of birth (YYYY-MM-DD)"),
     city: Optional[str] = Query(None, description="Filter by city of at least one address"),
     country: Optional[str] = Query(None, description="Filter by country of at least one address"),
+    sort: Optional[str] = Query(None, description="Sort by last_name or birth_date; prefix with - for descending"),
+    limit: Optional[int] = Query(None, description="Number of results to return (default: all)", ge=1),
+    offset: int = Query(0, description="Number of results to skip", ge=0),
 ):
-    results = list(persons.values())
+    order = parse_sort_param(sort, PERSON_SORTS)
+    if all(value is None for value in (uni, first_name, last_name, email, phone, birth_date, city, country)):
+        page = sorted_page(persons, "persons", order, None, offset, limit)
+        return list_response(PersonRead, [persons.unpack(p) for p in page])
+
+    # nested address filtering, resolved through the shared address table's indexes
+    indexed = [(field, value) for field, value in (("city", city), ("country", country)) if value is not None]
+    if indexed:
+        ids = set.intersection(*(persons.with_address(field, value) for field, value in indexed))
+        results = persons.in_insertion_order(ids)
+    else:
+        results = list(persons.data.values())
 
     if uni is not None:
         results = [p for p in results if p.uni == uni]
@@ -192,13 +506,8 @@ def list_persons(
     if birth_date is not None:
         results = [p for p in results if str(p.birth_date) == birth_date]
 
-    # nested address filtering
-    if city is not None:
-        results = [p for p in results if any(addr.city == city for addr in p.addresses)]
-    if country is not None:
-        results = [p for p in results if any(addr.country == country for addr in p.addresses)]
-
-    return results
+    page = sorted_page(persons, "persons", order, results, offset, limit)
+    return list_response(PersonRead, [persons.unpack(p) for p in page])
 
 @app.get("/persons/{person_id}", response_model=PersonRead)
 def get_person(person_id: UUID):
@@ -212,8 +521,8 @@ def update_person(person_id: UUID, update: PersonUpdate):
         raise HTTPException(status_code=404, detail="Person not found")
     stored = persons[person_id].model_dump()
     stored.update(update.model_dump(exclude_unset=True))
-    persons[person_id] = PersonRead(**stored)
-    return persons[person_id]
+    stored["updated_at"] = datetime.utcnow()
+    return put_person(PersonRead(**stored))
 
 # -----------------------------------------------------------------------------
 # Book endpoints
@@ -232,8 +541,14 @@ def list_books(
     max_price: Optional[float] = Query(None, description="Maximum price filter", ge=0),
     limit: int = Query(10, description="Number of results to return", ge=1, le=20),
     offset: int = Query(0, description="Number of results to skip", ge=0),
+    sort: Optional[str] = Query(None, description="Sort by price, title or created_at; prefix with - for descending"),
 ):
-    results = list(books.values())
+    order = parse_sort_param(sort, BOOK_SORTS)
+    if all(value is None for value in (author, title_contains, min_price, max_price)):
+        page = sorted_page(books, "books", order, None, offset, limit)
+        return list_response(BookRead, [books.unpack(b) for b in page])
+
+    results = list(books.data.values())
 
     if author is not None:
         results = [b for b in results if b.author is not None and b.author == author]
@@ -244,7 +559,8 @@ def list_books(
     if max_price is not None:
         results = [b for b in results if b.price <= max_price]
 
-    return results[offset:offset + limit]
+    page = sorted_page(books, "books", order, results, offset, limit)
+    return list_response(BookRead, [books.unpack(b) for b in page])
 
 @app.get("/books/{book_id}", response_model=BookRead)
 def get_book(
@@ -257,13 +573,8 @@ def get_book(
     book = books[book_id]
 
     if fields is not None:
-        field_list = [f.strip() for f in fields.split(',')]
-        valid_fields = ['id', 'title', 'author', 'price', 'created_at', 'updated_at']
-        result = {}
-        for field in field_list:
-            if field in valid_fields and hasattr(book, field):
-                result[field] = getattr(book, field)
-        return result
+        # a partial entity would fail response_model validation, so bypass it
+        return JSONResponse(project(book, parse_fields(BookRead, fields)))
 
     return book
 
@@ -273,6 +584,7 @@ def update_book(book_id: UUID, update: BookUpdate):
         raise HTTPException(status_code=404, detail="Book not found")
     stored = books[book_id].model_dump()
     stored.update(update.model_dump(exclude_unset=True))
+    stored["updated_at"] = datetime.utcnow()
     books[book_id] = BookRead(**stored)
     return books[book_id]
 
@@ -280,15 +592,19 @@ def update_book(book_id: UUID, update: BookUpdate):
 def replace_book(book_id: UUID, book: BookReplace):
     if book_id not in books:
         raise HTTPException(status_code=404, detail="Book not found")
-    book_read = BookRead(id=book_id, **book.model_dump())
-    books[book_id] = book_read
+    # a full replacement keeps the original creation time
+    book_read = BookRead(id=book_id, created_at=books[book_id].created_at, **book.model_dump())
+    books.put(book_read, action="replace")
     return book_read
 
 @app.delete("/books/{book_id}")
 def delete_book(book_id: UUID):
-    if book_id not in books:
-        raise HTTPException(status_code=404, detail="Book not found")
-    del books[book_id]
+    # under the holdings lock, so set_holding cannot add a holding for it meanwhile
+    with holdings.lock:
+        if book_id not in books:
+            raise HTTPException(status_code=404, detail="Book not found")
+        del books[book_id]
+        holdings.remove_book(book_id.int)
     return {"message": "Book deleted successfully"}
 
 # -----------------------------------------------------------------------------
@@ -299,7 +615,7 @@ def create_library(library: LibraryCreate):
     if library.id in libraries:
         raise HTTPException(status_code=400, detail="Library with this ID already exists")
 
-    for existing_library in libraries.values():
+    for existing_library in libraries.data.values():
         if existing_library.code.lower() == library.code.lower():
             raise HTTPException(status_code=400, detail="A library with this code already exists")
         if existing_library.name.lower() == library.name.lower():
@@ -314,10 +630,16 @@ def list_libraries(
     code: Optional[str] = Query(None, description="Filter by code"),
     name: Optional[str] = Query(None, description="Filter by name"),
     name_contains: Optional[str] = Query(None, description="Filter by name containing substring"),
-    limit: int = Query(50, description="Number of results to return", ge=1, le=20),
+    limit: int = Query(20, description="Number of results to return", ge=1, le=20),
     offset: int = Query(0, description="Number of results to skip", ge=0),
+    sort: Optional[str] = Query(None, description="Sort by code or name; prefix with - for descending"),
 ):
-    results = list(libraries.values())
+    order = parse_sort_param(sort, LIBRARY_SORTS)
+    if all(value is None for value in (code, name, name_contains)):
+        page = sorted_page(libraries, "libraries", order, None, offset, limit)
+        return list_response(LibraryRead, [libraries.unpack(l) for l in page])
+
+    results = list(libraries.data.values())
 
     if code is not None:
         results = [l for l in results if l.code.lower() == code.lower()]
@@ -326,7 +648,8 @@ def list_libraries(
     if name_contains is not None:
         results = [l for l in results if name_contains.lower() in l.name.lower()]
 
-    return results[offset:offset + limit]
+    page = sorted_page(libraries, "libraries", order, results, offset, limit)
+    return list_response(LibraryRead, [libraries.unpack(l) for l in page])
 
 @app.get("/libraries/{library_id}", response_model=LibraryRead)
 def get_library(library_id: UUID):
@@ -339,8 +662,8 @@ def update_library(library_id: UUID, update: LibraryUpdate):
     if library_id not in libraries:
         raise HTTPException(status_code=404, detail="Library not found")
     if update.code is not None or update.name is not None:
-        for existing_library in libraries.values():
-            if existing_library.id != library_id:
+        for existing_library in libraries.data.values():
+            if existing_library.id != library_id.int:
                 if update.code is not None and existing_library.code.lower() == update.code.lower():
                     raise HTTPException(status_code=400, detail="A library with this code already exists")
                 if update.name is not None and existing_library.name.lower() == update.name.lower():
@@ -348,6 +671,7 @@ def update_library(library_id: UUID, update: LibraryUpdate):
 
     stored = libraries[library_id].model_dump()
     stored.update(update.model_dump(exclude_unset=True))
+    stored["updated_at"] = datetime.utcnow()
     libraries[library_id] = LibraryRead(**stored)
     return libraries[library_id]
 
@@ -356,23 +680,164 @@ def replace_library(library_id: UUID, library: LibraryReplace):
     if library_id not in libraries:
         raise HTTPException(status_code=404, detail="Library not found")
 
-    for existing_library in libraries.values():
-        if existing_library.id != library_id:
+    for existing_library in libraries.data.values():
+        if existing_library.id != library_id.int:
             if existing_library.code.lower() == library.code.lower():
                 raise HTTPException(status_code=400, detail="A library with this code already exists")
             if existing_library.name.lower() == library.name.lower():
                 raise HTTPException(status_code=400, detail="A library with this name already exists")
 
-    library_read = LibraryRead(id=library_id, **library.model_dump())
-    libraries[library_id] = library_read
+    library_read = LibraryRead(id=library_id, created_at=libraries[library_id].created_at, **library.model_dump())
+    libraries.put(library_read, action="replace")
     return library_read
 
 @app.delete("/libraries/{library_id}")
 def delete_library(library_id: UUID):
+    # under the holdings lock, so set_holding cannot add a holding for it meanwhile
+    with holdings.lock:
+        if library_id not in libraries:
+            raise HTTPException(status_code=404, detail="Library not found")
+        del libraries[library_id]
+        holdings.remove_library(library_id.int)
+    return {"message": "Library deleted successfully"}
+
+# -----------------------------------------------------------------------------
+# Holding endpoints (copies of books held by libraries)
+# -----------------------------------------------------------------------------
+def require_holding_parties(library_id: UUID, book_id: UUID) -> None:
     if library_id not in libraries:
         raise HTTPException(status_code=404, detail="Library not found")
-    del libraries[library_id]
-    return {"message": "Library deleted successfully"}
+    if book_id not in books:
+        raise HTTPException(status_code=404, detail="Book not found")
+
+def change_holding(action, library_id: UUID, book_id: UUID, *args):
+    """Apply a HoldingStore change, mapping a missing holding to 404 and a conflict to 409."""
+    try:
+        return action(library_id.int, book_id.int, *args)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Holding not found")
+    except HoldingConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+@app.get("/libraries/{library_id}/books", response_model=List[HoldingRead])
+def list_library_holdings(
+    library_id: UUID,
+    limit: int = Query(10, description="Number of results to return", ge=1, le=100),
+    offset: int = Query(0, description="Number of results to skip", ge=0),
+):
+    if library_id not in libraries:
+        raise HTTPException(status_code=404, detail="Library not found")
+    return list_response(HoldingRead, [h.unpack() for h in holdings.books_held(library_id.int, offset, limit)])
+
+@app.get("/books/{book_id}/libraries", response_model=List[HoldingRead])
+def list_book_holdings(
+    book_id: UUID,
+    limit: int = Query(10, description="Number of results to return", ge=1, le=100),
+    offset: int = Query(0, description="Number of results to skip", ge=0),
+):
+    if book_id not in books:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return list_response(HoldingRead, [h.unpack() for h in holdings.libraries_holding(book_id.int, offset, limit)])
+
+@app.get("/libraries/{library_id}/availability", response_model=LibraryAvailability)
+def get_library_availability(library_id: UUID):
+    if library_id not in libraries:
+        raise HTTPException(status_code=404, detail="Library not found")
+    titles, copies, checked_out = holdings.availability(library_id.int)
+    return LibraryAvailability(
+        library_id=library_id, titles=titles, copies=copies, checked_out=checked_out, available=copies - checked_out,
+    )
+
+@app.get("/libraries/{library_id}/books/{book_id}", response_model=HoldingRead)
+def get_holding(library_id: UUID, book_id: UUID):
+    holding = holdings.get(library_id.int, book_id.int)
+    if holding is None:
+        raise HTTPException(status_code=404, detail="Holding not found")
+    return holding.unpack()
+
+@app.put("/libraries/{library_id}/books/{book_id}", response_model=HoldingRead)
+def set_holding(library_id: UUID, book_id: UUID, holding: HoldingUpdate):
+    # the book and library deletes cascade under the same lock, so both still exist when the holding is stored
+    with holdings.lock:
+        require_holding_parties(library_id, book_id)
+        return change_holding(holdings.set_copies, library_id, book_id, holding.copies).unpack()
+
+@app.delete("/libraries/{library_id}/books/{book_id}")
+def delete_holding(library_id: UUID, book_id: UUID):
+    change_holding(holdings.remove, library_id, book_id)
+    return {"message": "Holding deleted successfully"}
+
+@app.post("/libraries/{library_id}/books/{book_id}/checkout", response_model=HoldingRead)
+def checkout_copy(library_id: UUID, book_id: UUID):
+    return change_holding(holdings.checkout, library_id, book_id).unpack()
+
+@app.post("/libraries/{library_id}/books/{book_id}/return", response_model=HoldingRead)
+def return_copy(library_id: UUID, book_id: UUID):
+    return change_holding(holdings.return_copy, library_id, book_id).unpack()
+
+# -----------------------------------------------------------------------------
+# Search
+# -----------------------------------------------------------------------------
+@app.get("/search")
+def search(
+    q: str = Query(..., description="Search terms, matched against book title/author and person name/email", min_length=1),
+    types: Optional[str] = Query(None, description="Resources to search separated by comma: books, persons (default: both)"),
+    limit: int = Query(10, description="Number of results to return", ge=1, le=100),
+):
+    kinds = list(SEARCH_STORES) if types is None else [t.strip() for t in types.split(",") if t.strip()]
+    unknown = [kind for kind in kinds if kind not in SEARCH_STORES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown types: {', '.join(unknown)}")
+
+    candidates = (
+        (score, kind, doc_id)
+        for kind in kinds
+        for doc_id, score in search_indexes[kind].scores(q).items()
+    )
+    results = []
+    for score, kind, doc_id in top_k(candidates, limit):
+        store = SEARCH_STORES[kind]
+        record = store.data.get(doc_id)
+        if record is not None:
+            results.append({"type": kind, "id": UUID(int=doc_id), "score": round(score, 4), "item": store.unpack(record)})
+    return {"query": q, "results": results}
+
+@app.get("/autocomplete")
+def autocomplete(
+    field: str = Query(..., description="One of libraries.name, libraries.code, books.title, persons.last_name"),
+    prefix: str = Query(..., description="Typed prefix (case-insensitive)", min_length=1),
+    limit: int = Query(10, description="Number of completions to return", ge=1, le=50),
+):
+    index = autocomplete_indexes.get(field)
+    if index is None:
+        raise HTTPException(status_code=400, detail=f"Unknown field; use one of: {', '.join(autocomplete_indexes)}")
+    return {
+        "field": field,
+        "prefix": prefix,
+        "completions": [{"value": value, "count": count} for value, count in index.complete(prefix, limit)],
+    }
+
+# -----------------------------------------------------------------------------
+# Change feed (server-sent events)
+# -----------------------------------------------------------------------------
+@app.get("/events")
+async def stream_events(
+    resources: Optional[str] = Query(None, description="Resources to follow, separated by comma (default: all)"),
+    since: Optional[int] = Query(None, description="Resume after this sequence number", ge=0),
+    last_event_id: Optional[int] = Header(None, description="Standard SSE resume header; used when since is absent"),
+):
+    wanted = None
+    if resources is not None:
+        wanted = [r.strip() for r in resources.split(",") if r.strip()]
+        unknown = [r for r in wanted if r not in RESOURCES]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown resources: {', '.join(unknown)}")
+    subscriber, complete = changes.subscribe(wanted, since if since is not None else last_event_id)
+    return StreamingResponse(
+        changes.stream(subscriber, complete, heartbeat=SSE_HEARTBEAT),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # -----------------------------------------------------------------------------
 # Root
@@ -0,0 +1,200 @@
+"""Admission control: per-route concurrency limits, per-client rate limits, load shedding.
+
+Every non-exempt request takes a slot from a global limiter (kept below the
+threadpool size, so exempt probes always find a worker) and, for configured
+routes, from that route's limiter. A request is shed with 503 + Retry-After
+when its limiter's queue is full, or when it would have to queue while the
+route's recent latency is above the threshold. Each client key has a token
+bucket; an empty bucket yields 429 + Retry-After.
+
+Settings (environment):
+  FASTAPIMAXCONCURRENCY  global in-flight limit (default 32)
+  FASTAPILISTCONCURRENCY in-flight limit per list route (default 8, set in main)
+  FASTAPIMAXQUEUE        waiters per limiter before shedding (default 64)
+  FASTAPISHEDLATENCYMS   latency EWMA above which queueing is refused (default 1000)
+  FASTAPIRATELIMIT       requests/second per client key, 0 disables (default 0)
+  FASTAPIRATEBURST       token bucket capacity (default 2 x rate)
+"""
+from __future__ import annotations
+
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import anyio
+from fastapi import FastAPI
+from starlette.routing import compile_path
+
+from utils.metrics import counter
+
+MAX_CONCURRENCY = int(os.environ.get("FASTAPIMAXCONCURRENCY", 32))
+MAX_QUEUE = int(os.environ.get("FASTAPIMAXQUEUE", 64))
+SHED_LATENCY_MS = float(os.environ.get("FASTAPISHEDLATENCYMS", 1000))
+RATE_LIMIT = float(os.environ.get("FASTAPIRATELIMIT", 0))
+RATE_BURST = float(os.environ.get("FASTAPIRATEBURST", 2 * RATE_LIMIT))
+MAX_CLIENTS = 10000
+
+EXEMPT_PREFIXES = ("/health", "/metrics")
+CLIENT_KEY_HEADER = b"x-client-key"
+
+rejections = counter("admission_rejections_total", "Requests rejected by admission control.")
+
+
+def client_key(scope) -> str:
+    """The caller's identity: X-Client-Key if sent, else the peer address."""
+    for name, value in scope["headers"]:
+        if name == CLIENT_KEY_HEADER:
+            return value.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "-"
+
+
+class Limiter:
+    """Concurrency limit with a bounded wait queue and a latency EWMA."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, latency_threshold_ms: float):
+        self.name = name
+        self.semaphore = anyio.Semaphore(limit)
+        self.limit = limit
+        self.max_queue = max_queue
+        self.latency_threshold_ms = latency_threshold_ms
+        self.in_flight = 0
+        self.waiting = 0
+        self.latency_ms = 0.0
+
+    def should_shed(self) -> bool:
+        queued = self.in_flight + self.waiting - self.limit
+        if queued < 0:
+            return False
+        return queued >= self.max_queue or self.latency_ms > self.latency_threshold_ms
+
+    def retry_after(self) -> int:
+        # rough time for the current queue to drain
+        return max(1, math.ceil(self.latency_ms * (self.waiting + 1) / self.limit / 1000))
+
+    def observe(self, duration_ms: float) -> None:
+        self.latency_ms = 0.8 * self.latency_ms + 0.2 * duration_ms
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+
+class AdmissionMiddleware:
+    def __init__(
+        self,
+        app,
+        route_limits: Optional[Dict[str, int]] = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_queue: int = MAX_QUEUE,
+        shed_latency_ms: float = SHED_LATENCY_MS,
+        rate: float = RATE_LIMIT,
+        burst: float = RATE_BURST,
+        exempt: Sequence[str] = EXEMPT_PREFIXES,
+    ):
+        self.app = app
+        self.global_limiter = Limiter("*", max_concurrency, max_queue, shed_latency_ms)
+        # (method or None, compiled path regex, limiter) per "[METHOD ]/template" key
+        self.routes: List[Tuple] = []
+        for route, limit in (route_limits or {}).items():
+            method, _, path = route.rpartition(" ")
+            self.routes.append((method or None, compile_path(path)[0], Limiter(route, limit, max_queue, shed_latency_ms)))
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.exempt = tuple(exempt)
+
+    def route_limiter(self, method: str, path: str) -> Optional[Limiter]:
+        for route_method, regex, limiter in self.routes:
+            if (route_method is None or route_method == method) and regex.match(path):
+                return limiter
+        return None
+
+    def take_token(self, key: str) -> float:
+        """Consume a token for key; returns 0 if admitted, else seconds until one is available."""
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.burst, now)
+            if len(self.buckets) > MAX_CLIENTS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / self.rate
+
+    async def reject(self, send, status: int, retry_after: int, reason: str) -> None:
+        rejections.inc(reason=reason)
+        body = b'{"detail":"' + reason.replace("_", " ").encode() + b'"}'
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt):
+            await self.app(scope, receive, send)
+            return
+
+        if self.rate > 0:
+            wait = self.take_token(client_key(scope))
+            if wait:
+                await self.reject(send, 429, math.ceil(wait), "rate_limited")
+                return
+
+        limiters = [self.global_limiter]
+        route_limiter = self.route_limiter(scope["method"], scope["path"])
+        if route_limiter is not None:
+            limiters.insert(0, route_limiter)
+        for limiter in limiters:
+            if limiter.should_shed():
+                await self.reject(send, 503, limiter.retry_after(), "overloaded")
+                return
+
+        # count ourselves as waiting before the first await, so concurrent
+        # arrivals see an accurate queue when making their own decision
+        for limiter in limiters:
+            limiter.waiting += 1
+        acquired: List[Limiter] = []
+        started = None
+        try:
+            for limiter in limiters:
+                await limiter.semaphore.acquire()
+                limiter.waiting -= 1
+                limiter.in_flight += 1
+                acquired.append(limiter)
+            started = time.perf_counter()
+            await self.app(scope, receive, send)
+        finally:
+            for limiter in limiters:
+                if limiter not in acquired:
+                    limiter.waiting -= 1
+            for limiter in acquired:
+                limiter.in_flight -= 1
+                limiter.semaphore.release()
+                if started is not None:
+                    limiter.observe((time.perf_counter() - started) * 1000)
+
+
+def install_admission(app: FastAPI, route_limits: Dict[str, int], exempt: Sequence[str] = EXEMPT_PREFIXES) -> None:
+    """Limit concurrency globally and per ``"[METHOD ]/path/template"`` key, and rate per client.
+
+    Paths starting with an ``exempt`` prefix (probes, long-lived streams) bypass all checks.
+    """
+    app.add_middleware(AdmissionMiddleware, route_limits=route_limits, exempt=exempt)
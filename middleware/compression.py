@@ -0,0 +1,170 @@
+"""gzip/deflate response compression with a cache of compressed list responses.
+
+Responses at least FASTAPICOMPRESSMIN bytes long (a negative value disables
+the middleware) are compressed with the best encoding the client accepts.
+GET responses for the configured list paths are cached compressed, keyed by
+path, query string and encoding and tagged with the versions of the
+collections they read; a hit on the current version is replayed without
+running the handler. Compression runs in a worker thread, off the event loop.
+Streaming responses (text/event-stream) pass through untouched.
+"""
+from __future__ import annotations
+
+import gzip
+import os
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import anyio
+from fastapi import FastAPI
+
+from utils.memory import register_index
+
+COMPRESS_MIN_SIZE = int(os.environ.get("FASTAPICOMPRESSMIN", 1024))
+COMPRESS_LEVEL = int(os.environ.get("FASTAPICOMPRESSLEVEL", 6))
+COMPRESS_CACHE_SIZE = int(os.environ.get("FASTAPICOMPRESSCACHE", 128))
+
+ENCODERS: Dict[str, Callable[[bytes, int], bytes]] = {
+    "gzip": lambda body, level: gzip.compress(body, compresslevel=level, mtime=0),
+    "deflate": lambda body, level: zlib.compress(body, level),
+}
+
+# Headers recomputed per response, so not stored with cached bodies
+_UNCACHED_HEADERS = {b"content-length", b"content-encoding", b"server-timing", b"vary"}
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick gzip or deflate from an Accept-Encoding header, honouring q-values."""
+    best, best_q = None, 0.0
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        candidates = ENCODERS if name == "*" else ((name,) if name in ENCODERS else ())
+        for candidate in candidates:
+            # on equal q, keep the first listed (gzip before deflate for "*")
+            if q > best_q:
+                best, best_q = candidate, q
+    return best
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESS_MIN_SIZE,
+        level: int = COMPRESS_LEVEL,
+        cache_size: int = COMPRESS_CACHE_SIZE,
+        versions: Optional[Dict[str, Callable[[], Hashable]]] = None,
+        cache: Optional[OrderedDict] = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        self.cache_size = cache_size
+        # path -> callable returning the version of the collections it reads
+        self.versions = versions or {}
+        # (path, query, encoding) -> (version, status, headers, compressed body), LRU order
+        self.cache = OrderedDict() if cache is None else cache
+
+    def cache_key(self, scope, encoding: str) -> Optional[Tuple]:
+        if scope["path"] not in self.versions or scope["method"] != "GET" or self.cache_size <= 0:
+            return None
+        return scope["path"], scope.get("query_string", b""), encoding
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = negotiate(value.decode("latin-1"))
+                break
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = self.cache_key(scope, encoding)
+        version = None
+        if key is not None:
+            version = self.versions[key[0]]()
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] == version:
+                self.cache.move_to_end(key)
+                _, status, headers, body = cached
+                await self.send_compressed(send, status, headers, body, encoding)
+                return
+
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def buffering_send(message):
+            nonlocal passthrough
+            if message["type"] == "http.response.start":
+                headers = dict(message["headers"])
+                content_type = headers.get(b"content-type", b"")
+                if b"content-encoding" in headers or content_type.startswith(b"text/event-stream"):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start.update(message)
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            await self.finish(send, start, b"".join(chunks), encoding, key, version)
+
+        await self.app(scope, receive, buffering_send)
+
+    async def finish(self, send, start, body: bytes, encoding: str, key: Optional[Tuple], version: Hashable) -> None:
+        status = start["status"]
+        headers = [(k, v) for k, v in start["headers"] if k.lower() not in _UNCACHED_HEADERS]
+        if len(body) < self.minimum_size:
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+        compressed = await anyio.to_thread.run_sync(ENCODERS[encoding], body, self.level)
+        # only cache if the collections did not change while the handler ran
+        if key is not None and status == 200 and version == self.versions[key[0]]():
+            self.cache[key] = (version, status, headers, compressed)
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        extra = [(k, v) for k, v in start["headers"] if k.lower() == b"server-timing"]
+        await self.send_compressed(send, status, headers + extra, compressed, encoding)
+
+    async def send_compressed(self, send, status, headers, body: bytes, encoding: str) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": headers + [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def install_compression(app: FastAPI, versions: Dict[str, Callable[[], Hashable]]) -> None:
+    """Compress responses; ``versions`` maps cacheable list paths to collection versions."""
+    if COMPRESS_MIN_SIZE < 0:
+        return
+    cache: "OrderedDict[Tuple, Tuple[Hashable, int, List[Tuple[bytes, bytes]], bytes]]" = OrderedDict()
+    app.add_middleware(CompressionMiddleware, versions=versions, cache=cache)
+    register_index("compression_cache", lambda sample: {
+        "entries": len(cache),
+        "bytes": sum(len(body) for *_, body in cache.values()),
+    })
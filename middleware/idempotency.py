@@ -0,0 +1,181 @@
+"""Idempotency-Key support for POST endpoints.
+
+A POST carrying ``Idempotency-Key`` is run once per (client, path, key), the
+client identified as for rate limiting (X-Client-Key, else the peer address),
+so one caller can never be replayed another's response. The response
+status, headers and body are kept for FASTAPIIDEMPOTENCYTTL seconds (at most
+FASTAPIIDEMPOTENCYCACHE entries, oldest evicted first) and replayed for later
+requests with the same key, marked ``Idempotent-Replayed: true``. A duplicate
+arriving while the first is still running waits for it instead of running the
+handler again. Reusing a key with a different query string or body is
+rejected with 422.
+
+Only outcomes of the handler are kept: server errors and admission rejections
+(5xx, 429) are dropped, so a retry runs again.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import anyio
+from fastapi import FastAPI
+
+from middleware.admission import client_key
+from utils.memory import register_index
+from utils.metrics import counter
+
+IDEMPOTENCY_TTL = float(os.environ.get("FASTAPIIDEMPOTENCYTTL", 86400))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("FASTAPIIDEMPOTENCYCACHE", 10000))
+
+KEY_HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+
+requests_total = counter("idempotent_requests_total", "POST requests carrying an Idempotency-Key, by outcome.")
+
+
+class Entry:
+    __slots__ = ("fingerprint", "expires", "done", "status", "headers", "body")
+
+    def __init__(self, fingerprint: bytes, expires: float):
+        self.fingerprint = fingerprint
+        self.expires = expires
+        # set once the first request finished, whether or not it left a response
+        self.done = anyio.Event()
+        self.status: Optional[int] = None
+        self.headers: List[Tuple[bytes, bytes]] = []
+        self.body = b""
+
+
+class IdempotencyMiddleware:
+    def __init__(
+        self,
+        app,
+        ttl: float = IDEMPOTENCY_TTL,
+        max_entries: int = IDEMPOTENCY_CACHE_SIZE,
+        methods: Sequence[str] = ("POST",),
+        cache: Optional[OrderedDict] = None,
+    ):
+        self.app = app
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.methods = tuple(methods)
+        # (client, method, path, key) -> Entry, oldest first
+        self.cache = OrderedDict() if cache is None else cache
+
+    def evict(self, now: float) -> None:
+        cache = self.cache
+        while cache and (len(cache) > self.max_entries or next(iter(cache.values())).expires <= now):
+            cache.popitem(last=False)
+
+    async def reply(self, send, status: int, body: bytes, headers: Sequence[Tuple[bytes, bytes]] = ()) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.methods:
+            await self.app(scope, receive, send)
+            return
+        key = None
+        for name, value in scope["headers"]:
+            if name == KEY_HEADER:
+                key = value
+                break
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await self.reply(send, 400, b'{"detail":"Idempotency-Key must be 1-255 characters"}')
+            return
+
+        # the body is needed up front, to tell a retry from a reused key
+        chunks: List[bytes] = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        query = scope.get("query_string", b"")
+        # length-prefixed so no query/body split can collide with another
+        fingerprint = hashlib.sha256(b"%d:" % len(query) + query + body).digest()
+        cache_key = (client_key(scope), scope["method"], scope["path"], key)
+
+        while True:
+            now = time.monotonic()
+            self.evict(now)
+            entry = self.cache.get(cache_key)
+            if entry is None:
+                break
+            if entry.fingerprint != fingerprint:
+                requests_total.inc(outcome="mismatch")
+                await self.reply(send, 422, b'{"detail":"Idempotency-Key was used with a different request"}')
+                return
+            if not entry.done.is_set():
+                requests_total.inc(outcome="waited")
+                await entry.done.wait()
+                # the first request may have left nothing to replay; look again
+                continue
+            requests_total.inc(outcome="replayed")
+            await send({
+                "type": "http.response.start",
+                "status": entry.status,
+                "headers": entry.headers + [(b"idempotent-replayed", b"true")],
+            })
+            await send({"type": "http.response.body", "body": entry.body})
+            return
+
+        entry = self.cache[cache_key] = Entry(fingerprint, now + self.ttl)
+        self.evict(now)
+        requests_total.inc(outcome="executed")
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status: Optional[int] = None
+        headers: List[Tuple[bytes, bytes]] = []
+        response: List[bytes] = []
+
+        async def recording_send(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response.append(message.get("body", b""))
+            await send(message)
+
+        completed = False
+        try:
+            await self.app(scope, replay_receive, recording_send)
+            completed = True
+        finally:
+            if completed and status is not None and status < 500 and status != 429:
+                entry.status, entry.headers, entry.body = status, headers, b"".join(response)
+            elif self.cache.get(cache_key) is entry:
+                del self.cache[cache_key]
+            entry.done.set()
+
+
+def install_idempotency(app: FastAPI) -> None:
+    """Honour Idempotency-Key on POST requests."""
+    cache: "OrderedDict[Tuple[str, str, str, bytes], Entry]" = OrderedDict()
+    app.add_middleware(IdempotencyMiddleware, cache=cache)
+    register_index("idempotency_cache", lambda sample: {
+        "entries": len(cache),
+        "bytes": sum(len(entry.body) for entry in cache.values()),
+    })
@@ -0,0 +1,174 @@
+"""On-demand per-request profiling.
+
+Enabled by setting FASTAPIPROFILEDIR. A request is profiled when it carries
+``X-Profile: <FASTAPIPROFILETOKEN>`` or is picked by FASTAPIPROFILERATE (0..1).
+Each profiled request writes ``<name>.pstats`` plus a ``<name>.json`` sidecar
+with route, query parameters, status, duration and collection sizes.
+
+Untriggered requests only pay for a header scan and one random() call.
+
+Only one request is profiled at a time: a trigger arriving while another
+profile runs is ignored, as two cProfile profilers cannot be active together
+(on 3.11 they share the thread's profile hook, on 3.12+ the process-wide
+sys.monitoring tool slot). On 3.12+ that profiler also sees the threadpool
+worker, along with anything else running meanwhile.
+"""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+from uuid import uuid4
+
+import anyio
+from fastapi import FastAPI
+
+from middleware.timing import TimedRoute
+
+PROFILE_DIR = os.environ.get("FASTAPIPROFILEDIR")
+PROFILE_TOKEN = os.environ.get("FASTAPIPROFILETOKEN")
+PROFILE_RATE = float(os.environ.get("FASTAPIPROFILERATE", 0))
+PROFILE_HEADER = b"x-profile"
+
+# cProfile is per-thread before 3.12, so sync handlers need their own profiler
+PER_THREAD = sys.version_info < (3, 12)
+# held while a request is being profiled
+_active = threading.Lock()
+
+# Worker-thread profilers of the request being profiled (None when not profiling)
+_thread_profiles: ContextVar[Optional[List[cProfile.Profile]]] = ContextVar("_thread_profiles", default=None)
+
+
+class ProfiledRoute(TimedRoute):
+    """TimedRoute whose sync endpoints also profile inside the threadpool worker.
+
+    cProfile only sees the thread it is enabled on, so the middleware's profiler
+    misses sync handlers; this wrapper profiles them separately for merging.
+    """
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        if PER_THREAD and call is not None and not asyncio.iscoroutinefunction(call):
+            @wraps(call)
+            def profiled_call(*args, **kwargs):
+                profiles = _thread_profiles.get()
+                if profiles is None:
+                    return call(*args, **kwargs)
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    # another profiler owns the hook; run the request unprofiled
+                    return call(*args, **kwargs)
+                profiles.append(profile)
+                try:
+                    return call(*args, **kwargs)
+                finally:
+                    profile.disable()
+
+            self.dependant.call = profiled_call
+        return super().get_route_handler()
+
+
+class ProfilingMiddleware:
+    def __init__(
+        self,
+        app,
+        output_dir: str,
+        token: Optional[str] = None,
+        rate: float = 0.0,
+        annotate: Optional[Callable[[], Dict[str, Any]]] = None,
+    ):
+        self.app = app
+        self.output_dir = output_dir
+        self.token = token.encode() if token else None
+        self.rate = rate
+        self.annotate = annotate
+        os.makedirs(output_dir, exist_ok=True)
+
+    def triggered(self, scope) -> bool:
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return value == self.token
+        return self.rate > 0 and random.random() < self.rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.triggered(scope) or not _active.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.profiled(scope, receive, send)
+        finally:
+            _active.release()
+
+    async def profiled(self, scope, receive, send):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # an outside profiler is active
+            await self.app(scope, receive, send)
+            return
+
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        profiles: List[cProfile.Profile] = []
+        token = _thread_profiles.set(profiles)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - started
+            _thread_profiles.reset(token)
+            meta = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(scope.get("route"), "path", None),
+                "query": dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))),
+                "status": status.get("code"),
+                "duration_ms": round(duration * 1000, 3),
+                "collections": self.annotate() if self.annotate else {},
+            }
+            await anyio.to_thread.run_sync(self.write, [profile, *profiles], meta)
+
+    def write(self, profiles: List[cProfile.Profile], meta: Dict[str, Any]) -> None:
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", meta["route"] or meta["path"]).strip("_") or "root"
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{meta['method']}-{slug}-{uuid4().hex[:8]}"
+        stats = pstats.Stats(profiles[0])
+        for extra in profiles[1:]:
+            stats.add(extra)
+        stats.dump_stats(os.path.join(self.output_dir, name + ".pstats"))
+        with open(os.path.join(self.output_dir, name + ".json"), "w") as fh:
+            json.dump(meta, fh, indent=2)
+
+
+def install_profiling(app: FastAPI, annotate: Optional[Callable[[], Dict[str, Any]]] = None) -> None:
+    """Wire up profiling if FASTAPIPROFILEDIR is set; call before registering routes."""
+    if not PROFILE_DIR:
+        return
+    app.router.route_class = ProfiledRoute
+    app.add_middleware(
+        ProfilingMiddleware,
+        output_dir=PROFILE_DIR,
+        token=PROFILE_TOKEN,
+        rate=PROFILE_RATE,
+        annotate=annotate,
+    )
@@ -0,0 +1,104 @@
+"""Phase-level request timing, emitted as a Server-Timing header and histograms.
+
+Phases per route:
+  validate  - body read, request validation and threadpool dispatch
+  handler   - the endpoint function itself
+  serialize - response_model validation/serialization and response construction,
+              plus any serialization the endpoint does itself after calling
+              mark_serialize() (the fast path's list_response)
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Optional
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+
+from utils.metrics import histogram
+
+PHASES = ("validate", "handler", "serialize")
+
+phase_duration = histogram(
+    "http_request_phase_duration_ms",
+    "Time spent per request phase (validate, handler, serialize) in milliseconds.",
+)
+
+# Marks for the request being handled, shared with the threadpool worker
+_marks: ContextVar[Optional[Dict[str, float]]] = ContextVar("_marks", default=None)
+
+
+def _timed_call(call):
+    if asyncio.iscoroutinefunction(call):
+        @wraps(call)
+        async def timed(*args, **kwargs):
+            marks = _marks.get()
+            if marks is not None:
+                marks["handler_start"] = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                if marks is not None:
+                    marks["handler_end"] = time.perf_counter()
+    else:
+        @wraps(call)
+        def timed(*args, **kwargs):
+            marks = _marks.get()
+            if marks is not None:
+                marks["handler_start"] = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                if marks is not None:
+                    marks["handler_end"] = time.perf_counter()
+    return timed
+
+
+def mark_serialize() -> None:
+    """Count the rest of the running endpoint as the serialize phase."""
+    marks = _marks.get()
+    if marks is not None:
+        marks["serialize_start"] = time.perf_counter()
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that splits each request into phases and reports them."""
+
+    def get_route_handler(self):
+        if self.dependant.call is not None:
+            self.dependant.call = _timed_call(self.dependant.call)
+        handler = super().get_route_handler()
+        route = self.path
+
+        async def timed_handler(request):
+            marks = {"start": time.perf_counter()}
+            token = _marks.set(marks)
+            try:
+                response = await handler(request)
+            finally:
+                _marks.reset(token)
+            end = time.perf_counter()
+            handler_start = marks.get("handler_start", end)
+            serialize_start = marks.get("serialize_start", marks.get("handler_end", end))
+            durations = (
+                (handler_start - marks["start"]) * 1000,
+                (serialize_start - handler_start) * 1000,
+                (end - serialize_start) * 1000,
+            )
+            method = request.method
+            for phase, duration in zip(PHASES, durations):
+                phase_duration.observe(duration, route=route, method=method, phase=phase)
+            response.headers["Server-Timing"] = ", ".join(
+                f"{phase};dur={duration:.3f}" for phase, duration in zip(PHASES, durations)
+            ) + f", total;dur={(end - marks['start']) * 1000:.3f}"
+            return response
+
+        return timed_handler
+
+
+def install_timing(app: FastAPI) -> None:
+    """Time every route registered after this call."""
+    app.router.route_class = TimedRoute
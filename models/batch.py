@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from typing import List
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+MAX_BATCH_IDS = 1000
+
+
+class BatchGetRequest(BaseModel):
+    ids: List[UUID] = Field(
+        ...,
+        description=f"IDs to look up (1-{MAX_BATCH_IDS}); duplicates are returned once.",
+        min_length=1,
+        max_length=MAX_BATCH_IDS,
+    )
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "ids": [
+                        "550e8400-e29b-41d4-a716-446655440000",
+                        "aaaaaaaa-aaaa-4aaa-8aaa-aaaaaaaaaaaa",
+                    ]
+                }
+            ]
+        }
+    }
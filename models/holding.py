@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from datetime import datetime
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+
+class HoldingUpdate(BaseModel):
+    copies: int = Field(
+        ...,
+        description="Copies of the book the library owns; cannot drop below the copies checked out",
+        ge=0,
+        json_schema_extra={"example": 3},
+    )
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {"copies": 3},
+            ]
+        }
+    }
+
+
+class HoldingRead(BaseModel):
+    library_id: UUID = Field(
+        ...,
+        description="Library ID.",
+        json_schema_extra={"example": "7c8f1060-db19-4e6f-b087-2f944c4aede5"},
+    )
+    book_id: UUID = Field(
+        ...,
+        description="Book ID.",
+        json_schema_extra={"example": "90143569-66f2-493d-a4a6-b519bb75d10a"},
+    )
+    copies: int = Field(
+        ...,
+        description="Copies owned",
+        json_schema_extra={"example": 3},
+    )
+    checked_out: int = Field(
+        ...,
+        description="Copies currently checked out",
+        json_schema_extra={"example": 1},
+    )
+    available: int = Field(
+        ...,
+        description="Copies available for checkout",
+        json_schema_extra={"example": 2},
+    )
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Creation timestamp (UTC).",
+        json_schema_extra={"example": "2025-01-15T10:20:30Z"},
+    )
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Last update timestamp (UTC).",
+        json_schema_extra={"example": "2025-01-16T12:00:00Z"},
+    )
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "library_id": "7c8f1060-db19-4e6f-b087-2f944c4aede5",
+                    "book_id": "90143569-66f2-493d-a4a6-b519bb75d10a",
+                    "copies": 3,
+                    "checked_out": 1,
+                    "available": 2,
+                    "created_at": "2025-01-15T10:20:30Z",
+                    "updated_at": "2025-01-16T12:00:00Z",
+                }
+            ]
+        }
+    }
+
+
+class LibraryAvailability(BaseModel):
+    library_id: UUID = Field(..., description="Library ID.")
+    titles: int = Field(..., description="Distinct books held")
+    copies: int = Field(..., description="Copies owned across all books")
+    checked_out: int = Field(..., description="Copies currently checked out")
+    available: int = Field(..., description="Copies available for checkout")
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "library_id": "7c8f1060-db19-4e6f-b087-2f944c4aede5",
+                    "titles": 2,
+                    "copies": 5,
+                    "checked_out": 1,
+                    "available": 4,
+                }
+            ]
+        }
+    }
@@ -3,8 +3,9 @@ from __future__ import annotations
 from typing import Optional, List, Annotated
 from uuid import UUID, uuid4
 from datetime import date, datetime
-from pydantic import BaseModel, Field, EmailStr, StringConstraints
+from pydantic import BaseModel, Field, StringConstraints
 
+from utils.fastpath import EmailType
 from .address import AddressBase
 
 # Columbia UNI: 2–3 lowercase letters + 1–4 digits (e.g., abc1234)
@@ -27,7 +28,7 @@ class PersonBase(BaseModel):
         description="Family name.",
         json_schema_extra={"example": "Lovelace"},
     )
-    email: EmailStr = Field(
+    email: EmailType = Field(
         ...,
         description="Primary email address.",
         json_schema_extra={"example": "ada@example.com"},
@@ -122,7 +123,7 @@ class PersonUpdate(BaseModel):
     )
     first_name: Optional[str] = Field(None, json_schema_extra={"example": "Augusta"})
     last_name: Optional[str] = Field(None, json_schema_extra={"example": "King"})
-    email: Optional[EmailStr] = Field(None, json_schema_extra={"example": "ada@newmail.com"})
+    email: Optional[EmailType] = Field(None, json_schema_extra={"example": "ada@newmail.com"})
     phone: Optional[str] = Field(None, json_schema_extra={"example": "+44 20 7946 0958"})
     birth_date: Optional[date] = Field(None, json_schema_extra={"example": "1815-12-10"})
     addresses: Optional[List[AddressBase]] = Field(
@@ -0,0 +1,74 @@
+"""Type-ahead over a single text field: a sorted array of casefolded values.
+
+Distinct casefolded values are kept sorted, with a count of the records
+holding each, so completing a prefix is a bisect to the first candidate plus a
+walk over at most ``limit`` neighbours. The index follows its store through
+change listeners and remembers each record's value to undo it on change.
+"""
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+
+class PrefixIndex:
+    def __init__(self, field: str):
+        self.field = field
+        self.keys: List[str] = []
+        # casefolded value -> {original spelling: records}
+        self.forms: Dict[str, Dict[str, int]] = {}
+        # record ID -> its indexed value
+        self.values: Dict[int, str] = {}
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _add(self, value: str) -> None:
+        key = value.casefold()
+        forms = self.forms.get(key)
+        if forms is None:
+            forms = self.forms[key] = {}
+            insort(self.keys, key)
+        forms[value] = forms.get(value, 0) + 1
+
+    def _remove(self, value: str) -> None:
+        key = value.casefold()
+        forms = self.forms[key]
+        forms[value] -= 1
+        if not forms[value]:
+            del forms[value]
+        if not forms:
+            del self.forms[key]
+            del self.keys[bisect_left(self.keys, key)]
+
+    def update(self, record_id: int, record) -> None:
+        """Store listener: reindex a record's value, or drop it when record is None."""
+        value: Optional[str] = None if record is None else getattr(record, self.field)
+        with self.lock:
+            old = self.values.get(record_id)
+            if old == value:
+                return
+            if old is not None:
+                self._remove(old)
+                del self.values[record_id]
+            if value:
+                self._add(value)
+                self.values[record_id] = value
+
+    def complete(self, prefix: str, limit: int) -> List[Tuple[str, int]]:
+        """Up to limit (value, records) completions of prefix, in casefolded order.
+
+        Each value is reported in its most common original spelling.
+        """
+        prefix = prefix.casefold()
+        completions: List[Tuple[str, int]] = []
+        with self.lock:
+            keys = self.keys
+            i = bisect_left(keys, prefix)
+            while i < len(keys) and len(completions) < limit and keys[i].startswith(prefix):
+                forms = self.forms[keys[i]]
+                completions.append((max(forms, key=forms.get), sum(forms.values())))
+                i += 1
+        return completions
@@ -0,0 +1,128 @@
+"""In-memory change feed behind the server-sent-events endpoint.
+
+Stores publish events from their write paths (threadpool workers), with the
+store lock held, so sequence numbers follow commit order; each event gets the
+next sequence number and goes into a bounded ring buffer, so subscribers can
+resume from a sequence number while it is still buffered. Every subscriber
+has its own bounded queue: publishing never blocks, and a subscriber whose
+queue fills up is marked overflowed and disconnected with the sequence number
+to resume from, instead of slowing down writers.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Deque, Iterable, List, Optional, Set
+from uuid import UUID
+
+from pydantic import BaseModel
+
+RESOURCES = ("persons", "addresses", "books", "libraries")
+
+
+class ChangeEvent:
+    __slots__ = ("seq", "resource", "action", "id", "message")
+
+    def __init__(self, seq: int, resource: str, action: str, id: UUID, data: Optional[str]):
+        self.seq = seq
+        self.resource = resource
+        self.action = action
+        self.id = id
+        payload = (
+            f'{{"seq":{seq},"resource":"{resource}","action":"{action}","id":"{id}",'
+            f'"timestamp":"{datetime.utcnow().isoformat()}Z","data":{data or "null"}}}'
+        )
+        # pre-rendered once, shared by every subscriber
+        self.message = f"id: {seq}\nevent: {resource}.{action}\ndata: {payload}\n\n"
+
+
+class Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, resources: Optional[Set[str]], max_queue: int):
+        self.loop = loop
+        self.resources = resources
+        self.max_queue = max_queue
+        self.queue: Deque[ChangeEvent] = deque()
+        self.wakeup = asyncio.Event()
+        self.overflowed = False
+        self.last_seq = 0
+
+    def wants(self, event: ChangeEvent) -> bool:
+        return self.resources is None or event.resource in self.resources
+
+    def offer(self, event: ChangeEvent) -> None:
+        """Called with the feed lock held, from any thread; never blocks."""
+        if self.overflowed or not self.wants(event):
+            return
+        if len(self.queue) >= self.max_queue:
+            self.overflowed = True
+        else:
+            self.queue.append(event)
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+
+
+class ChangeFeed:
+    def __init__(self, capacity: int, subscriber_queue: int):
+        self.buffer: Deque[ChangeEvent] = deque(maxlen=capacity)
+        self.subscriber_queue = subscriber_queue
+        self.seq = 0
+        self.subscribers: Set[Subscriber] = set()
+        self.lock = threading.Lock()
+
+    def publish(self, resource: str, action: str, id: UUID, model: Optional[BaseModel] = None) -> ChangeEvent:
+        data = model.model_dump_json() if model is not None else None
+        with self.lock:
+            self.seq += 1
+            event = ChangeEvent(self.seq, resource, action, id, data)
+            self.buffer.append(event)
+            for subscriber in self.subscribers:
+                subscriber.offer(event)
+        return event
+
+    def subscribe(self, resources: Optional[Iterable[str]], since: Optional[int]) -> tuple:
+        """Register a subscriber, pre-filled with buffered events after ``since``.
+
+        Returns (subscriber, complete); complete is False when events after
+        ``since`` have already been evicted from the ring buffer, or when
+        ``since`` is ahead of this feed (a cursor from before a restart).
+        """
+        subscriber = Subscriber(asyncio.get_running_loop(), set(resources) if resources else None,
+                                self.subscriber_queue)
+        with self.lock:
+            complete = True
+            if since is not None:
+                oldest = self.buffer[0].seq if self.buffer else self.seq + 1
+                complete = oldest - 1 <= since <= self.seq
+                backlog: List[ChangeEvent] = [e for e in self.buffer if e.seq > since and subscriber.wants(e)]
+                # the backlog may exceed the live queue bound; it is drained first
+                subscriber.queue.extend(backlog)
+            subscriber.last_seq = self.seq if since is None else min(since, self.seq)
+            self.subscribers.add(subscriber)
+        return subscriber, complete
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    async def stream(self, subscriber: Subscriber, complete: bool, heartbeat: float):
+        """Async generator of SSE messages for one subscriber."""
+        try:
+            if not complete:
+                yield f"event: reset\ndata: {json.dumps({'seq': self.seq})}\n\n"
+            while True:
+                subscriber.wakeup.clear()
+                while subscriber.queue:
+                    event = subscriber.queue.popleft()
+                    subscriber.last_seq = event.seq
+                    yield event.message
+                if subscriber.overflowed:
+                    yield f"event: overflow\ndata: {json.dumps({'resume_from': subscriber.last_seq})}\n\n"
+                    return
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
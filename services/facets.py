@@ -0,0 +1,87 @@
+"""Incrementally maintained facet counts.
+
+A FacetIndex counts, per field, how many records hold each value, and for
+every ordered pair of its fields how many records holding value ``u`` of one
+also hold value ``v`` of the other. A facet panel, unscoped or scoped by one
+facet field, is then read off the counters in O(distinct values). Records may
+hold several values of a field (a person's addresses); each counts once per
+distinct value.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Sequence, Tuple
+
+Values = Dict[str, FrozenSet[str]]
+
+
+class FacetIndex:
+    def __init__(self, fields: Sequence[str], values: Optional[Callable[[object], Values]] = None):
+        self.fields = tuple(fields)
+        self.values = values or self.own_values
+        self.counts: Dict[str, Dict[str, int]] = {field: {} for field in self.fields}
+        # (scope field, scope value) -> field -> value -> count
+        self.scoped: Dict[Tuple[str, str], Dict[str, Dict[str, int]]] = {}
+        # record ID -> the values it was counted under
+        self.held: Dict[int, Values] = {}
+        self.lock = threading.Lock()
+
+    def own_values(self, record) -> Values:
+        return {
+            field: frozenset(() if getattr(record, field) is None else (getattr(record, field),))
+            for field in self.fields
+        }
+
+    def _apply(self, values: Values, delta: int) -> None:
+        for field, held in values.items():
+            counts = self.counts[field]
+            for value in held:
+                _bump(counts, value, delta)
+                for other, other_held in values.items():
+                    if other == field or not other_held:
+                        continue
+                    by_field = self.scoped.setdefault((field, value), {})
+                    scoped = by_field.setdefault(other, {})
+                    for other_value in other_held:
+                        _bump(scoped, other_value, delta)
+                    if not scoped:
+                        del by_field[other]
+                        if not by_field:
+                            del self.scoped[(field, value)]
+
+    def update(self, record_id: int, record) -> None:
+        """Store listener: recount a record, or uncount it when record is None."""
+        values = None if record is None else self.values(record)
+        with self.lock:
+            old = self.held.pop(record_id, None)
+            if old == values:
+                if values is not None:
+                    self.held[record_id] = values
+                return
+            if old is not None:
+                self._apply(old, -1)
+            if values is not None:
+                self._apply(values, 1)
+                self.held[record_id] = values
+
+    def facets(self, fields: Iterable[str], scope: Optional[Tuple[str, str]] = None) -> Dict[str, Dict[str, int]]:
+        """Counts per requested field, most frequent first, optionally among records holding scope."""
+        with self.lock:
+            source = self.counts if scope is None else self.scoped.get(scope, {})
+            result = {}
+            for field in fields:
+                if scope is not None and field == scope[0]:
+                    count = self.counts[field].get(scope[1])
+                    counts = {scope[1]: count} if count else {}
+                else:
+                    counts = source.get(field, {})
+                result[field] = dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+            return result
+
+
+def _bump(counts: Dict[str, int], value: str, delta: int) -> None:
+    count = counts.get(value, 0) + delta
+    if count:
+        counts[value] = count
+    else:
+        del counts[value]
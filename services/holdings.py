@@ -0,0 +1,128 @@
+"""Copies of books held by libraries, indexed in both directions.
+
+``by_library[library_id][book_id]`` and ``by_book[book_id][library_id]`` point
+at the same HoldingRecord, so either direction is a dict lookup and a page is a
+slice of an insertion-ordered dict. Per-library totals are adjusted in place
+on every change, and removing a book or library walks only its own holdings.
+"""
+from __future__ import annotations
+
+import threading
+from datetime import datetime
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from services.records import HoldingRecord, pack_datetime
+
+
+class HoldingConflict(Exception):
+    """The change would leave more copies checked out than owned (or fewer than zero)."""
+
+
+class HoldingStore:
+    def __init__(self):
+        self.by_library: Dict[int, Dict[int, HoldingRecord]] = {}
+        self.by_book: Dict[int, Dict[int, HoldingRecord]] = {}
+        # library ID -> [copies, checked_out] across its holdings
+        self.totals: Dict[int, List[int]] = {}
+        # checkout/return are read-check-write; handlers run on several threads.
+        # Reentrant, so callers can hold it across a check of the library and
+        # book and the change that relies on it (see set_holding, delete_book)
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return sum(len(held) for held in self.by_library.values())
+
+    def get(self, library_id: int, book_id: int) -> Optional[HoldingRecord]:
+        return self.by_library.get(library_id, {}).get(book_id)
+
+    def _require(self, library_id: int, book_id: int) -> HoldingRecord:
+        holding = self.get(library_id, book_id)
+        if holding is None:
+            raise KeyError((library_id, book_id))
+        return holding
+
+    def _touch(self, holding: HoldingRecord) -> None:
+        holding.updated_at = pack_datetime(datetime.utcnow())
+
+    def set_copies(self, library_id: int, book_id: int, copies: int) -> HoldingRecord:
+        """Create the holding or change its copy count."""
+        with self.lock:
+            holding = self.get(library_id, book_id)
+            totals = self.totals.setdefault(library_id, [0, 0])
+            if holding is None:
+                now = pack_datetime(datetime.utcnow())
+                holding = HoldingRecord(library_id, book_id, copies, 0, now, now)
+                self.by_library.setdefault(library_id, {})[book_id] = holding
+                self.by_book.setdefault(book_id, {})[library_id] = holding
+                totals[0] += copies
+                return holding
+            if copies < holding.checked_out:
+                raise HoldingConflict(f"{holding.checked_out} copies are checked out")
+            totals[0] += copies - holding.copies
+            holding.copies = copies
+            self._touch(holding)
+            return holding
+
+    def checkout(self, library_id: int, book_id: int) -> HoldingRecord:
+        with self.lock:
+            holding = self._require(library_id, book_id)
+            if holding.checked_out >= holding.copies:
+                raise HoldingConflict("No copies available")
+            holding.checked_out += 1
+            self.totals[library_id][1] += 1
+            self._touch(holding)
+            return holding
+
+    def return_copy(self, library_id: int, book_id: int) -> HoldingRecord:
+        with self.lock:
+            holding = self._require(library_id, book_id)
+            if holding.checked_out == 0:
+                raise HoldingConflict("No copies are checked out")
+            holding.checked_out -= 1
+            self.totals[library_id][1] -= 1
+            self._touch(holding)
+            return holding
+
+    def remove(self, library_id: int, book_id: int) -> None:
+        with self.lock:
+            holding = self._require(library_id, book_id)
+            if holding.checked_out:
+                raise HoldingConflict(f"{holding.checked_out} copies are checked out")
+            self._unlink(holding)
+
+    def _unlink(self, holding: HoldingRecord) -> None:
+        library_id, book_id = holding.library_id, holding.book_id
+        for index, key, other in ((self.by_library, library_id, book_id), (self.by_book, book_id, library_id)):
+            held = index[key]
+            del held[other]
+            if not held:
+                del index[key]
+        totals = self.totals[library_id]
+        totals[0] -= holding.copies
+        totals[1] -= holding.checked_out
+        if library_id not in self.by_library:
+            del self.totals[library_id]
+
+    def remove_library(self, library_id: int) -> None:
+        """Cascade a library delete; outstanding checkouts are dropped with it."""
+        with self.lock:
+            for holding in list(self.by_library.get(library_id, {}).values()):
+                self._unlink(holding)
+
+    def remove_book(self, book_id: int) -> None:
+        """Cascade a book delete; outstanding checkouts are dropped with it."""
+        with self.lock:
+            for holding in list(self.by_book.get(book_id, {}).values()):
+                self._unlink(holding)
+
+    def books_held(self, library_id: int, offset: int, limit: int) -> List[HoldingRecord]:
+        return list(islice(self.by_library.get(library_id, {}).values(), offset, offset + limit))
+
+    def libraries_holding(self, book_id: int, offset: int, limit: int) -> List[HoldingRecord]:
+        return list(islice(self.by_book.get(book_id, {}).values(), offset, offset + limit))
+
+    def availability(self, library_id: int) -> Tuple[int, int, int]:
+        """(titles, copies, checked_out) for a library, from the maintained counters."""
+        copies, checked_out = self.totals.get(library_id, (0, 0))
+        return len(self.by_library.get(library_id, ())), copies, checked_out
@@ -0,0 +1,153 @@
+"""Compact internal records for stored entities.
+
+Stores keep these ``__slots__`` records instead of pydantic models: UUIDs are
+packed to ints, naive UTC timestamps to integer microseconds since the epoch,
+and frequently repeated strings (author, city, state, country) are interned.
+Records are converted back to the ``*Read`` models only at the API boundary.
+"""
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from models.address import AddressBase, AddressRead
+from models.book import BookRead
+from models.holding import HoldingRead
+from models.library import LibraryRead
+from models.person import PersonRead
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def pack_uuid(value: UUID) -> int:
+    return value.int
+
+
+def unpack_uuid(value: int) -> UUID:
+    return UUID(int=value)
+
+
+def pack_datetime(value: datetime) -> Union[int, datetime]:
+    # timezone-aware values are kept as-is so they round-trip unchanged
+    if value.tzinfo is not None:
+        return value
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def datetime_micros(value: datetime) -> int:
+    """Microseconds since the epoch, converting timezone-aware values to UTC."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return pack_datetime(value)
+
+
+def unpack_datetime(value: Union[int, datetime]) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def intern_str(value: Optional[str]) -> Optional[str]:
+    return None if value is None else sys.intern(value)
+
+
+_UUID = (pack_uuid, unpack_uuid)
+_DATETIME = (pack_datetime, unpack_datetime)
+_INTERNED = (intern_str, lambda value: value)
+
+
+class Record:
+    """Base for slotted records; subclasses list fields in __slots__ and a model to convert to."""
+
+    __slots__ = ()
+    model: type = BaseModel
+    # field -> (pack, unpack); fields not listed are stored as-is
+    packers: Dict[str, Tuple[Callable[[Any], Any], Callable[[Any], Any]]] = {}
+
+    def __init__(self, *values: Any):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def pack(cls, model: BaseModel) -> "Record":
+        packers = cls.packers
+        return cls(*(
+            packers[name][0](getattr(model, name)) if name in packers else getattr(model, name)
+            for name in cls.__slots__
+        ))
+
+    def unpacked_fields(self) -> Dict[str, Any]:
+        packers = self.packers
+        return {
+            name: packers[name][1](getattr(self, name)) if name in packers else getattr(self, name)
+            for name in self.__slots__
+        }
+
+    def unpack(self) -> Any:
+        return self.model.model_construct(**self.unpacked_fields())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class AddressRecord(Record):
+    __slots__ = ("id", "street", "city", "state", "postal_code", "country", "created_at", "updated_at")
+    model = AddressRead
+    packers = {
+        "id": _UUID,
+        "city": _INTERNED,
+        "state": _INTERNED,
+        "country": _INTERNED,
+        "created_at": _DATETIME,
+        "updated_at": _DATETIME,
+    }
+
+    def content_key(self) -> Tuple[Any, ...]:
+        return (self.street, self.city, self.state, self.postal_code, self.country)
+
+    def embedded(self, id: Optional[int] = None) -> AddressBase:
+        """The AddressBase view embedded in PersonRead.addresses, under the ID the person used."""
+        return AddressBase.model_construct(
+            id=UUID(int=self.id if id is None else id), street=self.street, city=self.city, state=self.state,
+            postal_code=self.postal_code, country=self.country,
+        )
+
+
+class PersonRecord(Record):
+    __slots__ = (
+        "id", "uni", "first_name", "last_name", "email", "phone", "birth_date",
+        "addresses", "created_at", "updated_at",
+    )
+    model = PersonRead
+    # addresses holds the embedded address IDs as sent (row IDs or aliases of
+    # deduplicated rows); PersonStore resolves them through the address table
+    packers = {"id": _UUID, "created_at": _DATETIME, "updated_at": _DATETIME}
+
+
+class BookRecord(Record):
+    __slots__ = ("id", "title", "author", "price", "created_at", "updated_at")
+    model = BookRead
+    packers = {"id": _UUID, "author": _INTERNED, "created_at": _DATETIME, "updated_at": _DATETIME}
+
+
+class LibraryRecord(Record):
+    __slots__ = ("id", "code", "name", "created_at", "updated_at")
+    model = LibraryRead
+    packers = {"id": _UUID, "created_at": _DATETIME, "updated_at": _DATETIME}
+
+
+class HoldingRecord(Record):
+    __slots__ = ("library_id", "book_id", "copies", "checked_out", "created_at", "updated_at")
+    model = HoldingRead
+    packers = {"library_id": _UUID, "book_id": _UUID, "created_at": _DATETIME, "updated_at": _DATETIME}
+
+    def unpack(self) -> HoldingRead:
+        fields = self.unpacked_fields()
+        fields["available"] = self.copies - self.checked_out
+        return HoldingRead.model_construct(**fields)
@@ -0,0 +1,96 @@
+"""In-memory full-text search: inverted index, BM25 scoring, heap top-k.
+
+One SearchIndex per collection holds ``postings[term][doc_id] -> term
+frequency`` plus document lengths, and is kept current through the store's
+change listeners (see ``services.store.watch``), so a query only touches the postings of its own terms.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# letters and digits of any script; underscores still split, as in emails
+_TOKEN = re.compile(r"[^\W_]+")
+
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Casefolded alphanumeric runs (NFKC-normalized, any script); emails split into local part and domain labels."""
+    return _TOKEN.findall(unicodedata.normalize("NFKC", text).casefold()) if text else []
+
+
+class SearchIndex:
+    def __init__(self, fields: Sequence[str]):
+        self.fields = tuple(fields)
+        self.postings: Dict[str, Dict[int, int]] = {}
+        # doc ID -> its terms (with frequency), to unindex on change
+        self.docs: Dict[int, Counter] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def terms(self, record) -> Counter:
+        terms: Counter = Counter()
+        for field in self.fields:
+            terms.update(tokenize(getattr(record, field)))
+        return terms
+
+    def _remove(self, doc_id: int) -> None:
+        terms = self.docs.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.lengths.pop(doc_id)
+        for term in terms:
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+
+    def update(self, doc_id: int, record) -> None:
+        """Store listener: (re)index a record, or drop it when record is None."""
+        terms = None if record is None else self.terms(record)
+        with self.lock:
+            if terms is not None and self.docs.get(doc_id) == terms:
+                return
+            self._remove(doc_id)
+            if terms:
+                self.docs[doc_id] = terms
+                self.lengths[doc_id] = length = sum(terms.values())
+                self.total_length += length
+                for term, count in terms.items():
+                    self.postings.setdefault(term, {})[doc_id] = count
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """BM25 score of every document matching at least one query term."""
+        scores: Dict[int, float] = {}
+        with self.lock:
+            n = len(self.docs)
+            if not n:
+                return scores
+            avg_length = self.total_length / n
+            for term in set(tokenize(query)):
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                lengths = self.lengths
+                for doc_id, tf in docs.items():
+                    norm = tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths[doc_id] / avg_length))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+        return scores
+
+
+def top_k(results: Iterable[Tuple[float, str, int]], k: int) -> List[Tuple[float, str, int]]:
+    """The k best (score, kind, doc ID) triples, best first."""
+    return heapq.nlargest(k, results, key=lambda r: r[0])
+
@@ -0,0 +1,80 @@
+"""Sorted list pages without sorting the collection.
+
+Frequently requested orders get a SortedView: ``(key, id)`` entries kept
+sorted through the store's change listeners, so a page is a slice. Any other
+order picks the first ``offset + limit`` records with a heap.
+
+Sort parameters read ``field`` for ascending and ``-field`` for descending.
+Strings compare case-insensitively; missing values sort last either way.
+"""
+from __future__ import annotations
+
+import heapq
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from services.records import datetime_micros
+
+
+def parse_sort(sort: str, allowed: Sequence[str]) -> Tuple[str, bool]:
+    """(field, descending) for a sort parameter; ValueError if the field is not allowed."""
+    field, descending = (sort[1:], True) if sort.startswith("-") else (sort, False)
+    if field not in allowed:
+        raise ValueError(f"Cannot sort by {field!r}; use one of: {', '.join(allowed)}")
+    return field, descending
+
+
+def sort_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.casefold()
+    if isinstance(value, datetime):
+        return datetime_micros(value)
+    return value
+
+
+def top_records(records: Iterable, field: str, descending: bool, k: int) -> List:
+    """The first k records in the requested order, via a bounded heap."""
+    if descending:
+        # (True, v) > (False, None): present values first, missing last
+        return heapq.nlargest(k, records, key=lambda r: (getattr(r, field) is not None, sort_value(getattr(r, field)), r.id))
+    return heapq.nsmallest(k, records, key=lambda r: (getattr(r, field) is None, sort_value(getattr(r, field)), r.id))
+
+
+class SortedView:
+    """Record IDs of one store ordered by a required field."""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.entries: List[Tuple[Any, int]] = []
+        self.keys: Dict[int, Tuple[Any, int]] = {}
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def update(self, record_id: int, record) -> None:
+        """Store listener: reposition a record, or drop it when record is None."""
+        key = None if record is None else (sort_value(getattr(record, self.field)), record_id)
+        with self.lock:
+            old = self.keys.get(record_id)
+            if old == key:
+                return
+            if old is not None:
+                del self.entries[bisect_left(self.entries, old)]
+                del self.keys[record_id]
+            if key is not None:
+                insort(self.entries, key)
+                self.keys[record_id] = key
+
+    def page(self, data: Dict[int, Any], offset: int, limit: int, descending: bool) -> List:
+        """Records at [offset, offset + limit) in view order.
+
+        A record deleted from data but not yet dropped from the view is skipped.
+        """
+        with self.lock:
+            entries = reversed(self.entries) if descending else iter(self.entries)
+            ids = [record_id for _, record_id in islice(entries, offset, offset + limit)]
+        return [record for record in map(data.get, ids) if record is not None]
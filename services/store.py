@@ -0,0 +1,508 @@
+from __future__ import annotations
+
+import os
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Optional, Set, Tuple, Type, TypeVar
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from models.address import AddressBase, AddressRead
+from models.person import PersonRead
+from services.records import AddressRecord, PersonRecord, Record, intern_str, pack_datetime
+
+R = TypeVar("R", bound=Record)
+
+TOMBSTONE_LIMIT = int(os.environ.get("FASTAPITOMBSTONES", 10000))
+ChangeKey = Tuple[int, int]
+
+
+class RecordStore(Generic[R]):
+    """In-memory collection keyed by UUID, holding compact records.
+
+    Item access speaks pydantic models (packing on write, unpacking on read);
+    ``data`` exposes the raw ``{id_int: record}`` dict for scans and filters.
+    Subclasses maintain secondary structures through ``_on_put``/``_on_delete``.
+    ``version`` increases on every mutation, for caches keyed on collection state.
+
+    ``change_index`` keeps every live record and every retained delete
+    tombstone sorted by ``(stamp, id)``, so delta sync is a bisect plus a
+    slice. The stamp is the time of the write in microseconds, taken under the
+    store lock at insertion and strictly increasing, so a sync position never
+    skips a write that commits after it. At most ``tombstone_limit`` tombstones
+    are kept; ``horizon`` is the key of the newest one dropped, and older sync
+    positions are no longer exact.
+
+    Writes run on several threadpool workers; ``lock`` serializes them, along
+    with reads of the change index.
+
+    ``listeners`` are called as ``listener(id, record)`` after each put, and
+    with ``record=None`` after each delete, for indexes living outside the store.
+    ``feeds`` are called as ``feed(action, id, record)`` for each create,
+    update, replace or delete, with the store lock still held, so they see
+    writes in commit order (the change feed's sequence numbers follow it).
+    """
+
+    def __init__(self, record_cls: Type[R], tombstone_limit: int = TOMBSTONE_LIMIT):
+        self.record_cls = record_cls
+        self.data: Dict[int, R] = {}
+        self.version = 0
+        self.change_index: List[ChangeKey] = []
+        # id -> its key in change_index
+        self.change_keys: Dict[int, ChangeKey] = {}
+        # id -> deletion stamp, oldest first
+        self.tombstones: Dict[int, int] = {}
+        self.tombstone_limit = tombstone_limit
+        self.horizon: ChangeKey = (0, 0)
+        self.listeners: List[Callable[[int, Optional[R]], None]] = []
+        self.feeds: List[Callable[[str, int, Optional[R]], None]] = []
+        # id -> insertion sequence number; a re-put keeps its number, as it keeps its slot in data
+        self.positions: Dict[int, int] = {}
+        self.inserted = 0
+        # last change stamp handed out
+        self.clock = 0
+        self.lock = threading.RLock()
+
+    def _id(self, key: UUID) -> int:
+        return key.int
+
+    def _store(self, record: R) -> Optional[R]:
+        """Place a record in data; returns the record it replaced."""
+        old = self.data.get(record.id)
+        if old is None:
+            self.inserted += 1
+            self.positions[record.id] = self.inserted
+        self.data[record.id] = record
+        self.version += 1
+        return old
+
+    def _drop(self, id: int) -> Optional[R]:
+        record = self.data.pop(id, None)
+        if record is not None:
+            del self.positions[id]
+            self.version += 1
+        return record
+
+    def pack(self, model: BaseModel) -> R:
+        return self.record_cls.pack(model)
+
+    def unpack(self, record: R) -> BaseModel:
+        return record.unpack()
+
+    def _on_put(self, record: R, old: Optional[R]) -> None:
+        pass
+
+    def _on_delete(self, record: R) -> None:
+        pass
+
+    def _unlog(self, id: int) -> None:
+        key = self.change_keys.pop(id, None)
+        if key is not None:
+            del self.change_index[bisect_left(self.change_index, key)]
+
+    def _stamp(self) -> int:
+        self.clock = max(pack_datetime(datetime.utcnow()), self.clock + 1)
+        return self.clock
+
+    def _log_put(self, record: R) -> None:
+        self._unlog(record.id)
+        self.tombstones.pop(record.id, None)
+        key = (self._stamp(), record.id)
+        insort(self.change_index, key)
+        self.change_keys[record.id] = key
+
+    def _log_delete(self, id: int) -> None:
+        self._unlog(id)
+        key = (self._stamp(), id)
+        insort(self.change_index, key)
+        self.change_keys[id] = key
+        self.tombstones[id] = key[0]
+        while len(self.tombstones) > self.tombstone_limit:
+            oldest = next(iter(self.tombstones))
+            self.horizon = max(self.horizon, self.change_keys[oldest])
+            del self.tombstones[oldest]
+            self._unlog(oldest)
+
+    def _notify(self, id: int, record: Optional[R]) -> None:
+        for listener in self.listeners:
+            listener(id, record)
+
+    def _emit(self, action: str, id: int, record: Optional[R]) -> None:
+        for feed in self.feeds:
+            feed(action, id, record)
+
+    def touch(self, id: int, updated_at: int) -> None:
+        """Bump a record's packed ``updated_at`` when its representation changed indirectly."""
+        with self.lock:
+            record = self.data[id]
+            record.updated_at = updated_at
+            self.version += 1
+            self._log_put(record)
+            self._emit("update", id, record)
+
+    def changes_since(self, after: Optional[ChangeKey], limit: int) -> Tuple[List[Tuple[ChangeKey, Optional[R]]], bool]:
+        """Up to ``limit`` (key, record) pairs after ``after``, record None for tombstones; plus has_more."""
+        with self.lock:
+            start = 0 if after is None else bisect_right(self.change_index, after)
+            window = self.change_index[start:start + limit + 1]
+            return [(key, self.data.get(key[1])) for key in window[:limit]], len(window) > limit
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, key: UUID) -> bool:
+        return self._id(key) in self.data
+
+    def __getitem__(self, key: UUID) -> BaseModel:
+        return self.unpack(self.data[self._id(key)])
+
+    def __setitem__(self, key: UUID, model: BaseModel) -> None:
+        self.put(model)
+
+    def put(self, model: BaseModel, action: str = "update") -> None:
+        """Store a model; feeds see "create" for a new ID, else ``action`` ("update" or "replace")."""
+        record = self.pack(model)
+        with self.lock:
+            self._put_record(record, action)
+
+    def _put_record(self, record: R, action: str = "update") -> None:
+        old = self._store(record)
+        self._on_put(record, old)
+        self._log_put(record)
+        self._emit("create" if old is None else action, record.id, record)
+        self._notify(record.id, record)
+
+    def __delitem__(self, key: UUID) -> None:
+        with self.lock:
+            record = self._drop(self._id(key))
+            if record is None:
+                raise KeyError(key)
+            self._on_delete(record)
+            self._log_delete(record.id)
+            self._emit("delete", record.id, None)
+            self._notify(record.id, None)
+
+    def get(self, key: UUID, default: Optional[BaseModel] = None) -> Optional[BaseModel]:
+        record = self.data.get(self._id(key))
+        return default if record is None else self.unpack(record)
+
+    def record(self, key: UUID) -> Optional[R]:
+        return self.data.get(self._id(key))
+
+    def in_insertion_order(self, ids: Iterable[int]) -> List[R]:
+        """Records for a set of IDs, ordered as a full scan would return them."""
+        with self.lock:
+            positions = self.positions
+            return [self.data[i] for i in sorted((i for i in ids if i in positions), key=positions.__getitem__)]
+
+    def keys(self) -> Iterator[UUID]:
+        return (UUID(int=key) for key in self.data)
+
+    def values(self) -> Iterator[BaseModel]:
+        return (self.unpack(record) for record in self.data.values())
+
+    def items(self) -> Iterator[Tuple[UUID, BaseModel]]:
+        return ((UUID(int=key), self.unpack(record)) for key, record in self.data.items())
+
+
+class AddressConflict(ValueError):
+    """An embedded address reuses the ID of a row it may not change."""
+
+
+class AddressStore(RecordStore[AddressRecord]):
+    """The single address table, shared by /addresses and persons' embedded addresses.
+
+    A direct write through /addresses pins its row. An embedding with an unknown
+    ID whose content matches an existing row reuses that row, keeping the sent
+    ID as an alias of it; rows created by embeddings are dropped once no ID
+    references them. Sharing is copy-on-write: an alias whose content changes
+    gets its own row under its ID, and a row changing under its own ID first
+    moves its aliases to a copy with the old content. An embedding may change
+    a row only if the row is unpinned and no other person sent the same ID.
+    """
+
+    INDEXED_FIELDS = ("city", "state", "country")
+
+    def __init__(self):
+        super().__init__(AddressRecord)
+        # address ID as sent (row ID or alias) -> references to it from persons
+        self.refs: Dict[int, int] = {}
+        self.pinned: Set[int] = set()
+        self.by_content: Dict[Tuple[Any, ...], int] = {}
+        # alias ID -> row ID, and row ID -> its aliases
+        self.aliases: Dict[int, int] = {}
+        self.row_aliases: Dict[int, Set[int]] = {}
+        self.indexes: Dict[str, Dict[str, Set[int]]] = {field: {} for field in self.INDEXED_FIELDS}
+
+    def resolve(self, aid: int) -> int:
+        """Row ID for an address ID that may be an alias."""
+        return self.aliases.get(aid, aid)
+
+    def row(self, aid: int) -> AddressRecord:
+        return self.data[self.aliases.get(aid, aid)]
+
+    def _id(self, key: UUID) -> int:
+        return self.resolve(key.int)
+
+    def _read(self, record: AddressRecord, aid: int) -> AddressRead:
+        """A row as read under the ID asked for, which may be one of its aliases."""
+        model = record.unpack()
+        return model if aid == record.id else model.model_copy(update={"id": UUID(int=aid)})
+
+    def __getitem__(self, key: UUID) -> AddressRead:
+        return self._read(self.data[self._id(key)], key.int)
+
+    def get(self, key: UUID, default: Optional[BaseModel] = None) -> Optional[BaseModel]:
+        record = self.data.get(self._id(key))
+        return default if record is None else self._read(record, key.int)
+
+    def lookup(self, field: str, value: str) -> Set[int]:
+        """IDs of addresses whose indexed field equals value."""
+        return self.indexes[field].get(value, set())
+
+    def _index(self, record: AddressRecord) -> None:
+        self.by_content.setdefault(record.content_key(), record.id)
+        for field, index in self.indexes.items():
+            value = getattr(record, field)
+            if value is not None:
+                index.setdefault(value, set()).add(record.id)
+
+    def _unindex(self, record: AddressRecord) -> None:
+        key = record.content_key()
+        if self.by_content.get(key) == record.id:
+            del self.by_content[key]
+        for field, index in self.indexes.items():
+            value = getattr(record, field)
+            ids = index.get(value)
+            if ids is not None:
+                ids.discard(record.id)
+                if not ids:
+                    del index[value]
+
+    def _on_put(self, record: AddressRecord, old: Optional[AddressRecord]) -> None:
+        if old is not None:
+            self._unindex(old)
+        else:
+            self.pinned.add(record.id)
+        self._index(record)
+
+    def _on_delete(self, record: AddressRecord) -> None:
+        self._unindex(record)
+        self.pinned.discard(record.id)
+
+    def put(self, model: BaseModel, action: str = "update") -> None:
+        """Direct write through /addresses; leaves what other IDs sharing the row read unchanged."""
+        record = self.pack(model)
+        aid = record.id
+        with self.lock:
+            rid = self.resolve(aid)
+            if rid != aid:
+                # written through an alias: the alias becomes a row of its own
+                self._unalias(aid)
+                self._put_record(record, action)
+                self._collect(rid)
+                return
+            existing = self.data.get(aid)
+            if existing is not None and existing.content_key() != record.content_key():
+                self._split_aliases(aid)
+            self._put_record(record, action)
+
+    def _add(self, record: AddressRecord, action: str) -> None:
+        """Store a row an embedding created or changed (no pin)."""
+        old = self._store(record)
+        if old is not None:
+            self._unindex(old)
+        self._index(record)
+        self._log_put(record)
+        self._emit(action, record.id, record)
+        self._notify(record.id, record)
+
+    def _unalias(self, aid: int) -> None:
+        rid = self.aliases.pop(aid)
+        others = self.row_aliases[rid]
+        others.discard(aid)
+        if not others:
+            del self.row_aliases[rid]
+
+    def _split_aliases(self, rid: int) -> None:
+        """Before row rid changes, move its aliases to a copy of it under one of their IDs."""
+        moved = self.row_aliases.pop(rid, None)
+        if not moved:
+            return
+        heir = min(moved)
+        for aid in moved:
+            del self.aliases[aid]
+        moved.discard(heir)
+        for aid in moved:
+            self.aliases[aid] = heir
+        if moved:
+            self.row_aliases[heir] = moved
+        existing = self.data[rid]
+        self._add(AddressRecord(heir, *existing.content_key(), existing.created_at, existing.updated_at), "create")
+        # deduplication now lands on the copy, as rid is about to change
+        self.by_content[existing.content_key()] = heir
+
+    def _collect(self, rid: int) -> None:
+        """Drop row rid once nothing pins or references it, directly or through an alias."""
+        if rid in self.pinned or self.refs.get(rid) or rid in self.row_aliases:
+            return
+        record = self._drop(rid)
+        if record is not None:
+            self._on_delete(record)
+            self._log_delete(rid)
+            self._emit("delete", rid, None)
+            self._notify(rid, None)
+
+    @staticmethod
+    def _content(address: AddressBase) -> Tuple[Any, ...]:
+        return (address.street, intern_str(address.city), intern_str(address.state),
+                address.postal_code, intern_str(address.country))
+
+    def check(self, address: AddressBase, sole_holder: Callable[[int], bool]) -> None:
+        """Raise AddressConflict if acquiring address would change a row the caller does not own.
+
+        ``sole_holder(aid)`` tells whether the acquiring person is the only one that sent the ID aid.
+        """
+        with self.lock:
+            aid = address.id.int
+            existing = self.data.get(self.resolve(aid))
+            if existing is None or existing.content_key() == self._content(address):
+                return
+            if aid in self.pinned or not sole_holder(aid):
+                raise AddressConflict(
+                    f"Address {address.id} already exists with different content; change it through PATCH /addresses/{address.id}"
+                )
+
+    def acquire(self, address: AddressBase) -> int:
+        """Reference an embedded address (after check()); returns the ID to store, as sent."""
+        with self.lock:
+            now = pack_datetime(datetime.utcnow())
+            aid = address.id.int
+            rid = self.resolve(aid)
+            content = self._content(address)
+            existing = self.data.get(rid)
+            if existing is not None and existing.content_key() != content:
+                if rid != aid:
+                    # the alias holder changed it: leave the shared row and fall through as a new ID
+                    self._unalias(aid)
+                    self._collect(rid)
+                    existing = None
+                else:
+                    # a row this person alone references by ID: the embedding carries the latest content
+                    self._split_aliases(rid)
+                    self._add(AddressRecord(rid, *content, existing.created_at, now), "update")
+            if existing is None:
+                shared = self.by_content.get(content)
+                if shared is not None:
+                    self.aliases[aid] = shared
+                    self.row_aliases.setdefault(shared, set()).add(aid)
+                else:
+                    self._add(AddressRecord(aid, *content, now, now), "create")
+            self.refs[aid] = self.refs.get(aid, 0) + 1
+            return aid
+
+    def release(self, aid: int) -> None:
+        with self.lock:
+            count = self.refs.get(aid, 0) - 1
+            if count > 0:
+                self.refs[aid] = count
+                return
+            self.refs.pop(aid, None)
+            rid = self.resolve(aid)
+            if rid != aid:
+                self._unalias(aid)
+            self._collect(rid)
+
+
+class PersonStore(RecordStore[PersonRecord]):
+    """Persons referencing rows of an AddressStore by ID; joins happen on unpack."""
+
+    def __init__(self, addresses: AddressStore):
+        super().__init__(PersonRecord)
+        self.addresses = addresses
+        # one lock for both tables: a person write changes address rows, and an
+        # address write bumps the persons embedding it
+        self.lock = addresses.lock
+        # address ID as sent (row ID or alias) -> IDs of persons referencing it
+        self.by_address: Dict[int, Set[int]] = {}
+        # the person being written, which is not bumped for its own address changes
+        self._writing: Optional[int] = None
+        # a changed address row changes how its persons read
+        addresses.listeners.append(self._address_changed)
+
+    def holders(self, rid: int) -> Set[int]:
+        """IDs of persons reading address row rid, under its ID or one of its aliases."""
+        ids = set(self.by_address.get(rid, ()))
+        for aid in self.addresses.row_aliases.get(rid, ()):
+            ids |= self.by_address.get(aid, set())
+        return ids
+
+    def _address_changed(self, rid: int, record: Optional[AddressRecord]) -> None:
+        for person_id in self.holders(rid):
+            person = self.data[person_id]
+            # a copy made for moved aliases is not newer than what its holders read
+            if record is not None and person_id != self._writing and record.updated_at > person.updated_at:
+                self.touch(person_id, record.updated_at)
+            self._notify(person_id, person)
+
+    def put(self, model: BaseModel, action: str = "update") -> None:
+        """Store a person, creating, changing or dropping the address rows it references.
+
+        Raises AddressConflict, before changing anything, if an embedded
+        address would overwrite a row pinned by /addresses or an ID other
+        persons sent too.
+        """
+        addresses = self.addresses
+        person_id = model.id.int
+        sole_holder = lambda aid: self.by_address.get(aid, set()) <= {person_id}
+        record = PersonRecord.pack(model)
+        with self.lock:
+            for address in model.addresses:
+                addresses.check(address, sole_holder)
+            self._writing = person_id
+            try:
+                record.addresses = tuple(addresses.acquire(a) for a in model.addresses)
+                self._put_record(record, action)
+            finally:
+                self._writing = None
+
+    def unpack(self, record: PersonRecord) -> PersonRead:
+        fields = record.unpacked_fields()
+        row = self.addresses.row
+        fields["addresses"] = [row(aid).embedded(aid) for aid in record.addresses]
+        return PersonRead.model_construct(**fields)
+
+    def _on_put(self, record: PersonRecord, old: Optional[PersonRecord]) -> None:
+        for aid in record.addresses:
+            self.by_address.setdefault(aid, set()).add(record.id)
+        if old is not None:
+            self._release(old, keep=set(record.addresses))
+
+    def _on_delete(self, record: PersonRecord) -> None:
+        self._release(record, keep=set())
+
+    def _release(self, record: PersonRecord, keep: Set[int]) -> None:
+        for aid in record.addresses:
+            if aid not in keep:
+                persons = self.by_address.get(aid)
+                if persons is not None:
+                    persons.discard(record.id)
+                    if not persons:
+                        del self.by_address[aid]
+            self.addresses.release(aid)
+
+    def with_address(self, field: str, value: str) -> Set[int]:
+        """IDs of persons with at least one address whose field equals value."""
+        ids: Set[int] = set()
+        for rid in self.addresses.lookup(field, value):
+            ids |= self.holders(rid)
+        return ids
+
+
+def watch(store: RecordStore, index: Any) -> None:
+    """Feed a store's current records to ``index.update(id, record)`` and follow its changes."""
+    for record_id, record in list(store.data.items()):
+        index.update(record_id, record)
+    store.listeners.append(index.update)
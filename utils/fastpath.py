@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from fastapi import Response
+from pydantic import EmailStr, TypeAdapter
+from pydantic.networks import validate_email
+
+from middleware.timing import mark_serialize
+from utils.memory import register_index
+
+# Opt-in: FASTAPIFASTPATH=1 turns on the cached validation/serialization paths.
+ENABLED = os.environ.get("FASTAPIFASTPATH", "0") == "1"
+EMAIL_CACHE_SIZE = int(os.environ.get("FASTAPIEMAILCACHE", 65536))
+
+
+@lru_cache(maxsize=EMAIL_CACHE_SIZE)
+def normalize_email(value: str) -> str:
+    """Memoized email-validator normalization; invalid input raises and is not cached."""
+    return validate_email(value)[1]
+
+
+class CachedEmailStr(EmailStr):
+    """EmailStr with the same schema, but repeated addresses skip email-validator."""
+
+    @classmethod
+    def _validate(cls, input_value: str, /) -> str:
+        return normalize_email(input_value)
+
+
+# Email type used by the models; plain EmailStr unless the fast path is enabled.
+EmailType = CachedEmailStr if ENABLED else EmailStr
+
+_list_adapters: Dict[type, TypeAdapter] = {}
+
+
+def list_adapter(model: type) -> TypeAdapter:
+    """Return the (compiled once) TypeAdapter for List[model]."""
+    adapter = _list_adapters.get(model)
+    if adapter is None:
+        adapter = TypeAdapter(List[model])
+        _list_adapters[model] = adapter
+    return adapter
+
+
+register_index("email_cache", lambda sample: {"entries": normalize_email.cache_info().currsize, "bytes": None})
+register_index("list_adapters", lambda sample: {"entries": len(_list_adapters), "bytes": None})
+
+
+def list_response(model: type, items: List[Any]) -> Any:
+    """Serialize a list of stored models directly, skipping FastAPI's re-validation.
+
+    Falls through to the plain list when the fast path is disabled, so the
+    route's response_model still drives serialization in that case.
+    """
+    if not ENABLED:
+        return items
+    mark_serialize()
+    return Response(content=list_adapter(model).dump_json(items), media_type="application/json")
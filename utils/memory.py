@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import sys
+import tracemalloc
+from enum import Enum
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from pydantic import BaseModel
+
+# name -> callable(sample) returning {"entries": ..., "bytes": ...}
+_indexes: Dict[str, Callable[[int], Dict[str, Any]]] = {}
+
+_ATOMIC = (str, bytes, int, float, bool, type(None))
+
+# Elements measured per container nested inside a sampled entry (postings
+# lists, id sets); larger ones are extrapolated from these
+NESTED_SAMPLE = 32
+
+
+def _sampled_sizeof(items: Iterable[Any], count: int, limit: Optional[int], measure: Callable[[Any], int]) -> int:
+    """Total of measure(item) over a container's items, extrapolated from ``limit`` of them."""
+    if limit is None or count <= limit:
+        return sum(map(measure, items))
+    picked = sample_items(items, count, limit)
+    return int(sum(map(measure, picked)) / len(picked) * count)
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None, limit: Optional[int] = None) -> int:
+    """sys.getsizeof over the object graph, counting each object once.
+
+    With ``limit``, containers holding more items than that are estimated from
+    a sample of them, so the cost no longer grows with the size of the graph.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, (type, Enum)):
+        # classes and enum members are shared, not owned by the entity
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, _ATOMIC):
+        return size
+    if isinstance(obj, dict):
+        size += _sampled_sizeof(obj.items(), len(obj), limit,
+                                lambda item: deep_sizeof(item[0], seen, limit) + deep_sizeof(item[1], seen, limit))
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += _sampled_sizeof(obj, len(obj), limit, lambda item: deep_sizeof(item, seen, limit))
+    elif isinstance(obj, BaseModel):
+        # field-name keys are shared by every instance, so only values are counted
+        size += sys.getsizeof(obj.__dict__) + sys.getsizeof(obj.__pydantic_fields_set__)
+        for value in obj.__dict__.values():
+            size += deep_sizeof(value, seen, limit)
+        if obj.__pydantic_extra__:
+            size += deep_sizeof(obj.__pydantic_extra__, seen, limit)
+        if obj.__pydantic_private__:
+            size += deep_sizeof(obj.__pydantic_private__, seen, limit)
+    else:
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(obj.__dict__, seen, limit)
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if hasattr(obj, slot):
+                    size += deep_sizeof(getattr(obj, slot), seen, limit)
+    return size
+
+
+def sample_items(items: Iterable[Any], count: int, sample: int) -> List[Any]:
+    """Up to `sample` items, touching no more than that many.
+
+    Sequences are sampled evenly by index; other iterables (dict views) cannot
+    be indexed, so their first `sample` items are taken instead of walking all.
+    """
+    if isinstance(items, Sequence):
+        step = max(1, count // sample)
+        return [items[i] for i in range(0, count, step)][:sample]
+    return list(islice(items, sample))
+
+
+def estimate_size(container: Any, sample: int) -> Dict[str, Any]:
+    """Entry count and estimated deep size of a container, from a sample of its items.
+
+    Containers nested in the sampled items are sampled too (NESTED_SAMPLE), so
+    an index of large postings or ID sets costs no more than a flat one.
+    """
+    count = len(container)
+    if count == 0:
+        return {"entries": 0, "bytes": sys.getsizeof(container), "bytes_per_entry": 0}
+    if isinstance(container, dict):
+        picked = sample_items(container.items(), count, sample)
+        sizes = [deep_sizeof(key, limit=NESTED_SAMPLE) + deep_sizeof(value, limit=NESTED_SAMPLE) for key, value in picked]
+    else:
+        sizes = [deep_sizeof(item, limit=NESTED_SAMPLE) for item in sample_items(container, count, sample)]
+    per_entry = sum(sizes) / len(sizes)
+    return {
+        "entries": count,
+        "bytes": int(sys.getsizeof(container) + per_entry * count),
+        "bytes_per_entry": int(per_entry),
+    }
+
+
+def register_index(name: str, describe: Callable[[int], Dict[str, Any]]) -> None:
+    """Expose an index or cache in the memory report."""
+    _indexes[name] = describe
+
+
+def tracemalloc_stop() -> Dict[str, Any]:
+    """Stop tracing and release its bookkeeping."""
+    was_tracing = tracemalloc.is_tracing()
+    tracemalloc.stop()
+    return {"tracing": "stopped" if was_tracing else "inactive", "top": []}
+
+
+def tracemalloc_top(limit: int) -> Dict[str, Any]:
+    """Top allocation sites; the first call starts tracing and returns nothing yet.
+
+    Tracing slows every allocation until tracemalloc_stop() is called.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        return {"tracing": "started", "top": []}
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    return {
+        "tracing": "active",
+        "top": [
+            {"location": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:limit]
+        ],
+    }
+
+
+def memory_report(collections: Dict[str, Dict[Any, Any]], sample: int, top: int = 0, stop: bool = False) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "collections": {name: estimate_size(store, sample) for name, store in collections.items()},
+        "indexes": {name: describe(sample) for name, describe in _indexes.items()},
+    }
+    if stop:
+        report["tracemalloc"] = tracemalloc_stop()
+    elif top:
+        report["tracemalloc"] = tracemalloc_top(top)
+    return report
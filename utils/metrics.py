@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple, Union
+
+# Latency buckets in milliseconds (upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS_MS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Fixed-bucket histogram keyed by label set, rendered in Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # per-bucket counts, then +Inf count, sum
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict[LabelKey, List[float]]:
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.snapshot().items()):
+            labels = ",".join(f'{k}="{v}"' for k, v in key)
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative:g}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {cumulative:g}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]:g}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative:g}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by label set."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._series: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            labels = ",".join(f'{k}="{v}"' for k, v in key)
+            lines.append(f"{self.name}{{{labels}}} {value:g}")
+        return lines
+
+
+REGISTRY: List[Union[Histogram, Counter]] = []
+
+
+def counter(name: str, help_text: str) -> Counter:
+    metric = Counter(name, help_text)
+    REGISTRY.append(metric)
+    return metric
+
+
+def histogram(name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS_MS) -> Histogram:
+    metric = Histogram(name, help_text, buckets)
+    REGISTRY.append(metric)
+    return metric
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"